@@ -0,0 +1,297 @@
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+from time import time
+
+from benchmark.origin import origin_port, get_host_address, run_origin
+from benchmark.worker import set_settings
+from utils.config import config
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+url_paths = ["/master.m3u8", "/media.m3u8", "/redirect", "/stream.ts", "/stream.flv"]
+
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmark",
+        description="Benchmark the speed test against a local fake HLS/TS origin"
+    )
+    parser.add_argument("--mode", choices=["speed", "channel"], default="speed",
+                        help="drive utils.speed.get_speed on a pool of workers, or the whole utils.channel.test_speed")
+    parser.add_argument("--urls", type=int, default=10000, help="number of synthetic urls")
+    parser.add_argument("--urls-per-channel", type=int, default=10, help="number of urls of each channel")
+    parser.add_argument("--hosts", type=int, default=50, help="number of virtual hosts (at most 250)")
+    parser.add_argument("--port", type=int, default=origin_port, help="port of the origin")
+    parser.add_argument("--concurrency", type=int, default=None,
+                        help="number of workers in the speed mode, default: speed_test_limit")
+    parser.add_argument("--bandwidth", type=float, default=10,
+                        help="bandwidth of each host (M/s), 0 for unlimited")
+    parser.add_argument("--bandwidth-jitter", type=float, default=0.5,
+                        help="random fraction the bandwidth of each host varies by")
+    parser.add_argument("--latency", type=float, default=20, help="latency of each host (ms)")
+    parser.add_argument("--error-rate", type=float, default=0.02, help="fraction of the requests answered with 503")
+    parser.add_argument("--dead", type=float, default=0.1,
+                        help="fraction of the hosts that are dead, half refuse the connection and half time out")
+    parser.add_argument("--segment-size", type=float, default=1, help="size of the TS segments (M)")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the host profiles")
+    parser.add_argument("--config", action="append", default=[], metavar="KEY=VALUE",
+                        help="override an option of the Settings section, can be repeated")
+    return parser.parse_args()
+
+
+def get_profiles(args) -> list[dict]:
+    """
+    Get the profiles (bandwidth, latency, error rate, dead) of the virtual hosts
+    """
+    rng = random.Random(args.seed)
+    dead_count = round(args.hosts * args.dead)
+    return [
+        {
+            "bandwidth": args.bandwidth * 1024 * 1024 * (1 + rng.uniform(-1, 1) * args.bandwidth_jitter),
+            "latency": args.latency * rng.uniform(0.5, 1.5),
+            "error_rate": args.error_rate,
+            "dead": ("refused" if index % 2 else "timeout") if index >= args.hosts - dead_count else None
+        }
+        for index in range(args.hosts)
+    ]
+
+
+def get_channel_data(count: int, hosts: int, port: int, urls_per_channel: int) -> dict:
+    """
+    Get the channel data of the synthetic urls, the urls rotate over the hosts and the kinds of streams
+    """
+    data = {}
+    for index in range(count):
+        host = f"http://{get_host_address(index % hosts)}:{port}"
+        name = f"Channel {index // urls_per_channel}"
+        data.setdefault(name, []).append({
+            "id": index,
+            "url": f"{host}{url_paths[index // hosts % len(url_paths)]}?id={index}",
+            "host": host,
+            "origin": "subscribe",
+            "ipv_type": "ipv4",
+            "date": None,
+            "resolution": None,
+            "extra_info": ""
+        })
+    return {"Benchmark": data}
+
+
+def get_worker_pids(exclude: set[int]) -> list[int]:
+    """
+    Get the pids of the child processes (the speed test workers), except the excluded
+    """
+    pids = []
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return pids
+    for entry in entries:
+        if not entry.isdigit() or int(entry) in exclude:
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == os.getpid():
+            pids.append(int(entry))
+    return pids
+
+
+def get_socket_count(pid: int | str = "self") -> int | None:
+    """
+    Get the number of open sockets of the process, None if it is not available
+    """
+    try:
+        fds = os.listdir(f"/proc/{pid}/fd")
+    except OSError:
+        return None
+    count = 0
+    for fd in fds:
+        try:
+            count += os.readlink(f"/proc/{pid}/fd/{fd}").startswith("socket:")
+        except OSError:
+            pass
+    return count
+
+
+def get_peak_rss(who: int = None) -> float | None:
+    """
+    Get the peak RSS (M) of the process, or of the largest waited child process, None if it is not available
+    """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF if who is None else who).ru_maxrss
+    return rss / 1024 / 1024 if sys.platform == "darwin" else rss / 1024
+
+
+async def sample_sockets(stats: dict, exclude: set[int], interval: float = 0.1):
+    """
+    Sample the peak number of open sockets of the process and its workers until cancelled
+    """
+    while True:
+        counts = [get_socket_count(), *(get_socket_count(pid) for pid in get_worker_pids(exclude))]
+        if counts[0] is not None:
+            stats["sockets"] = max(stats.get("sockets", 0), sum(count or 0 for count in counts))
+        await asyncio.sleep(interval)
+
+
+def get_percentile(values: list[float], percent: float) -> float:
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(int(len(values) * percent / 100), len(values) - 1)]
+
+
+async def run_speed(data: dict, concurrency: int) -> tuple[list[float], list[dict]]:
+    """
+    Test the urls with utils.speed.get_speed on a pool of workers sharing a session,
+    get the durations (s) and the results
+    """
+    from utils.speed import get_speed, get_speed_test_session, start_speed_test_log, stop_speed_test_log
+
+    infos = [info for info_list in data["Benchmark"].values() for info in info_list]
+    durations = []
+    results = []
+    queue = asyncio.Queue()
+    for info in infos:
+        queue.put_nowait(info)
+
+    async def worker(session):
+        while not queue.empty():
+            info = queue.get_nowait()
+            start_time = time()
+            results.append(await get_speed(info, session=session))
+            durations.append(time() - start_time)
+
+    start_speed_test_log()
+    try:
+        async with get_speed_test_session() as session:
+            await asyncio.gather(*(worker(session) for _ in range(min(concurrency, len(infos)))))
+    finally:
+        stop_speed_test_log()
+    return durations, results
+
+
+async def run_channel(data: dict, port: int) -> tuple[list[float], list[dict]]:
+    """
+    Test the urls with utils.channel.test_speed, get the durations (s) and the results,
+    the durations are timed around utils.speed.get_speed, or taken from the origin
+    with the multiprocess speed test, which then only covers the urls of the alive hosts,
+    the workers of the multiprocess speed test are started with the settings of the benchmark
+    """
+    import updates.epg  # noqa: F401, the updates are imported before utils.channel as in main.py
+    import utils.channel as channel
+    import utils.speed as speed
+    import benchmark.worker as worker
+
+    durations = []
+    get_speed = speed.get_speed
+    speed_test_worker = speed.speed_test_worker
+
+    async def timed_get_speed(*args, **kwargs):
+        start_time = time()
+        try:
+            return await get_speed(*args, **kwargs)
+        finally:
+            durations.append(time() - start_time)
+
+    speed.get_speed = timed_get_speed
+    speed.speed_test_worker = worker.speed_test_worker
+    try:
+        grouped_results = await channel.test_speed(data, ipv6=True)
+    finally:
+        speed.get_speed = get_speed
+        speed.speed_test_worker = speed_test_worker
+    results = [result for channel_obj in grouped_results.values() for info_list in channel_obj.values() for result in
+               info_list]
+    if config.open_speed_test_multiprocess:
+        from utils.speed import get_speed_test_session
+        async with get_speed_test_session() as session:
+            async with session.get(f"http://{get_host_address(0)}:{port}/_stats") as response:
+                durations = list((await response.json()).values())
+    return durations, results
+
+
+async def run(args, data: dict, origin_pid: int) -> dict:
+    stats = {}
+    sampler = asyncio.create_task(sample_sockets(stats, {origin_pid}))
+    start_time = time()
+    try:
+        if args.mode == "speed":
+            durations, results = await run_speed(data, args.concurrency or config.speed_test_limit)
+        else:
+            durations, results = await run_channel(data, args.port)
+    finally:
+        sampler.cancel()
+    stats["elapsed"] = time() - start_time
+    stats["worker_rss"] = get_peak_rss(resource.RUSAGE_CHILDREN) if resource else None
+    stats["durations"] = durations
+    stats["results"] = results
+    return stats
+
+
+def main():
+    args = get_args()
+    if not 0 < args.hosts <= 250:
+        sys.exit("The number of hosts must be between 1 and 250")
+    output_dir = tempfile.mkdtemp(prefix="iptv-api-benchmark-")
+    settings = {
+        "speed_test_log_path": os.path.join(output_dir, "log/speed_test.log"),
+        "speed_test_data_path": os.path.join(output_dir, "data/speed_test.db"),
+        "config": {"speed_test_filter_host": "False", "speed_test_cache_ttl": "0"}
+    }
+    for option in args.config:
+        key, _, value = option.partition("=")
+        settings["config"][key.strip()] = value.strip()
+    set_settings(settings)
+    if args.dead >= 1 and args.mode == "channel" and config.open_speed_test_multiprocess:
+        sys.exit("At least one host must be alive to collect the stats of the origin")
+
+    profiles = get_profiles(args)
+    context = multiprocessing.get_context("spawn")
+    ready, stop = context.Event(), context.Event()
+    origin = context.Process(
+        target=run_origin,
+        args=(profiles, args.port, int(args.segment_size * 1024 * 1024), ready, stop),
+        daemon=True
+    )
+    origin.start()
+    if not ready.wait(30):
+        origin.terminate()
+        sys.exit("The origin failed to start")
+    data = get_channel_data(args.urls, args.hosts, args.port, args.urls_per_channel)
+    print(f"Benchmark mode: {args.mode}, urls: {args.urls}, hosts: {args.hosts}, "
+          f"dead hosts: {sum(1 for profile in profiles if profile['dead'])}, output: {output_dir}")
+    try:
+        stats = asyncio.run(run(args, data, origin.pid))
+    finally:
+        stop.set()
+        origin.join(5)
+        if origin.is_alive():
+            origin.terminate()
+
+    durations = stats["durations"]
+    results = stats["results"]
+    peak_rss = get_peak_rss()
+    print(f"Tested urls: {len(results)}, alive: {sum(1 for result in results if result.get('speed'))}, "
+          f"with resolution: {sum(1 for result in results if result.get('resolution'))}")
+    print(f"Elapsed: {stats['elapsed']:.2f} s, URLs/sec: {len(results) / stats['elapsed']:.2f}")
+    print(f"Test duration p50: {get_percentile(durations, 50):.3f} s, p99: {get_percentile(durations, 99):.3f} s")
+    worker_rss = stats["worker_rss"] if config.open_speed_test_multiprocess and args.mode == "channel" else None
+    print(f"Peak RSS: {f'{peak_rss:.1f} M' if peak_rss is not None else 'N/A'}"
+          f"{f', workers: {worker_rss:.1f} M' if worker_rss else ''}, "
+          f"peak open sockets: {stats.get('sockets', 'N/A')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+import sys
+from collections import Counter
+
+from utils.limiter import ChannelQueue
+
+
+def check_channel_queue_mixed_hosts() -> bool:
+    """
+    Check that a channel held back by a busy host does not stop the dispatch of the channels of other hosts,
+    with one channel of 100 urls on host A, two channels of 50 urls each on a distinct host and 2 items per host,
+    every host with queued items must have 2 items running once the queue returns None
+    """
+    limit_per_host = 2
+    items = [(0, "A")] * 100 + [(channel, f"{channel}-{i}") for channel in (1, 2) for i in range(50)]
+    queue = ChannelQueue(
+        items, channel_key=lambda item: item[0], host_key=lambda item: item[1], limit_per_host=limit_per_host
+    )
+    queued = Counter(host for _, host in items)
+    running = []
+    while len(queue):
+        while (item := queue.get()) is not None:
+            queued[item[1]] -= 1
+            running.append(item)
+        active = Counter(host for _, host in running)
+        blocked = [host for host, count in queued.items() if count and active[host] < limit_per_host]
+        if blocked:
+            print(f"❌ Channel queue with mixed hosts: {len(blocked)} hosts not dispatched, "
+                  f"running: {len(running)}, queued: {len(queue)}")
+            return False
+        queue.done(running.pop(0))
+    print("✅ Channel queue with mixed hosts")
+    return True
+
+
+def main():
+    checks = [check_channel_queue_mixed_hosts]
+    sys.exit(0 if all([check() for check in checks]) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+h264_sps = bytes.fromhex("67f40028919b280f0044fc4e0220000003002000000641e30632c0")
+h264_pps = bytes.fromhex("68ebe3c44844")
+ts_packet_size = 188
+ts_pmt_pid = 0x1000
+ts_video_pid = 0x100
+ts_h264_stream_type = 0x1B
+nal_start_code = b"\x00\x00\x00\x01"
+nal_filler = b"\xaa"
+
+
+def get_crc32_mpeg2(data: bytes) -> int:
+    """
+    Get the CRC32/MPEG-2 of the PSI section
+    """
+    crc = 0xFFFFFFFF
+    for byte in data:
+        crc ^= byte << 24
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x04C11DB7 if crc & 0x80000000 else crc << 1) & 0xFFFFFFFF
+    return crc
+
+
+def get_ts_packet(pid: int, payload: bytes, start: bool = False, counter: int = 0) -> bytes:
+    """
+    Get the TS packet of the payload (at most 184 bytes), the rest is filled with the adaptation field stuffing
+    """
+    stuffing = 184 - len(payload)
+    header = bytes([0x47, (0x40 if start else 0) | (pid >> 8), pid & 0xFF, (0x30 if stuffing else 0x10) | counter & 0x0F])
+    if not stuffing:
+        return header + payload
+    adaptation = bytes([stuffing - 1]) + (b"\x00" + b"\xff" * (stuffing - 2) if stuffing > 1 else b"")
+    return header + adaptation + payload
+
+
+def get_psi_packet(pid: int, table_id: int, table_id_extension: int, body: bytes) -> bytes:
+    """
+    Get the TS packet of the PSI section with the pointer field and the CRC
+    """
+    length = 5 + len(body) + 4
+    section = bytes([table_id, 0xB0 | (length >> 8), length & 0xFF, table_id_extension >> 8,
+                     table_id_extension & 0xFF, 0xC1, 0x00, 0x00]) + body
+    section += get_crc32_mpeg2(section).to_bytes(4, "big")
+    return get_ts_packet(pid, b"\x00" + section, start=True)
+
+
+def get_ts_segment(size: int) -> bytes:
+    """
+    Get the synthetic MPEG-TS segment of about the size, with the PAT, the PMT of an H.264 stream
+    and a PES starting with the SPS and PPS, so the resolution can be parsed from the segment
+    """
+    pat = get_psi_packet(0, 0x00, 1, bytes([0x00, 0x01, 0xE0 | (ts_pmt_pid >> 8), ts_pmt_pid & 0xFF]))
+    pmt = get_psi_packet(ts_pmt_pid, 0x02, 1, bytes([
+        0xE0 | (ts_video_pid >> 8), ts_video_pid & 0xFF, 0xF0, 0x00,
+        ts_h264_stream_type, 0xE0 | (ts_video_pid >> 8), ts_video_pid & 0xFF, 0xF0, 0x00
+    ]))
+    packet_count = max(size // ts_packet_size - 2, 1)
+    es = nal_start_code + h264_sps + nal_start_code + h264_pps + nal_start_code + b"\x65"
+    pes = b"\x00\x00\x01\xe0\x00\x00\x80\x00\x00" + es
+    pes += nal_filler * max(packet_count * 184 - len(pes), 0)
+    packets = [
+        get_ts_packet(ts_video_pid, pes[i:i + 184], start=i == 0, counter=i // 184)
+        for i in range(0, len(pes), 184)
+    ]
+    return pat + pmt + b"".join(packets)
+
+
+def get_flv_tag(tag_type: int, body: bytes, timestamp: int = 0) -> bytes:
+    """
+    Get the FLV tag of the body with the previous tag size
+    """
+    header = bytes([tag_type]) + len(body).to_bytes(3, "big") + (timestamp & 0xFFFFFF).to_bytes(3, "big") + bytes(
+        [timestamp >> 24 & 0xFF]) + bytes(3)
+    return header + body + (len(header) + len(body)).to_bytes(4, "big")
+
+
+def get_flv_header() -> bytes:
+    """
+    Get the FLV header with the AVC sequence header tag, so the resolution can be parsed from the stream
+    """
+    record = bytes([0x01, h264_sps[1], h264_sps[2], h264_sps[3], 0xFF, 0xE1]) + len(h264_sps).to_bytes(
+        2, "big") + h264_sps + b"\x01" + len(h264_pps).to_bytes(2, "big") + h264_pps
+    return b"FLV\x01\x01\x00\x00\x00\x09" + bytes(4) + get_flv_tag(9, b"\x17\x00\x00\x00\x00" + record)
+
+
+def get_flv_video_tag(size: int, timestamp: int = 0) -> bytes:
+    """
+    Get the FLV video tag of a synthetic AVC NAL unit of about the size
+    """
+    nal = b"\x65" + nal_filler * max(size - 10, 1)
+    return get_flv_tag(9, b"\x27\x01\x00\x00\x00" + len(nal).to_bytes(4, "big") + nal, timestamp)
+
+
+def get_master_playlist(query: str) -> str:
+    """
+    Get the master playlist with two variants of the media playlist
+    """
+    return (
+        "#EXTM3U\n"
+        f"#EXT-X-STREAM-INF:BANDWIDTH=800000,RESOLUTION=1280x720\nmedia.m3u8?{query}\n"
+        f"#EXT-X-STREAM-INF:BANDWIDTH=2000000,RESOLUTION=1920x1080\nmedia.m3u8?{query}\n"
+    )
+
+
+def get_media_playlist(query: str, segment_count: int = 6, duration: int = 2) -> str:
+    """
+    Get the live media playlist of the segments
+    """
+    return f"#EXTM3U\n#EXT-X-TARGETDURATION:{duration}\n#EXT-X-MEDIA-SEQUENCE:1\n" + "".join(
+        f"#EXTINF:{duration}.0,\nseg{i}.ts?{query}\n" for i in range(segment_count)
+    )
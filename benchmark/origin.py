@@ -0,0 +1,188 @@
+import asyncio
+import random
+from time import time
+
+from aiohttp import web
+
+from benchmark.media import get_flv_header, get_flv_video_tag, get_master_playlist, get_media_playlist, \
+    get_ts_segment
+
+origin_port = 18180
+chunk_interval = 0.05
+stream_duration = 30
+
+
+def get_host_address(index: int) -> str:
+    """
+    Get the loopback address of the virtual host
+    """
+    return f"127.0.0.{index + 1}"
+
+
+def get_host_profile(request: web.Request) -> dict:
+    """
+    Get the profile of the virtual host the request is sent to
+    """
+    return request.app["profiles"][request.host.rsplit(":", 1)[0]]
+
+
+async def write_throttled(response: web.StreamResponse, body: bytes, bandwidth: float):
+    """
+    Write the body in chunks paced by the bandwidth (bytes/s) of the host
+    """
+    chunk_size = max(int(bandwidth * chunk_interval), 1024) if bandwidth else len(body)
+    for i in range(0, len(body), chunk_size):
+        start_time = time()
+        await response.write(body[i:i + chunk_size])
+        if bandwidth:
+            await asyncio.sleep(max(chunk_interval - (time() - start_time), 0))
+
+
+@web.middleware
+async def profile_middleware(request: web.Request, handler):
+    """
+    Apply the latency and error rate of the host, and record the span of the requests of each url id
+    """
+    profile = get_host_profile(request)
+    url_id = request.query.get("id")
+    spans = request.app["spans"]
+    if url_id:
+        span = spans.setdefault(url_id, [time(), 0])
+        span[0] = min(span[0], time())
+    try:
+        if profile["latency"]:
+            await asyncio.sleep(profile["latency"] / 1000)
+        if random.random() < profile["error_rate"]:
+            raise web.HTTPServiceUnavailable()
+        return await handler(request)
+    finally:
+        if url_id:
+            spans[url_id][1] = time()
+
+
+async def master_handler(request: web.Request) -> web.Response:
+    return web.Response(
+        text=get_master_playlist(request.query_string), content_type="application/vnd.apple.mpegurl"
+    )
+
+
+async def media_handler(request: web.Request) -> web.Response:
+    return web.Response(text=get_media_playlist(request.query_string), content_type="application/vnd.apple.mpegurl")
+
+
+async def redirect_handler(request: web.Request):
+    raise web.HTTPFound(f"/master.m3u8?{request.query_string}")
+
+
+async def segment_handler(request: web.Request) -> web.StreamResponse:
+    profile = get_host_profile(request)
+    body = request.app["segment"]
+    response = web.StreamResponse(headers={"Content-Type": "video/mp2t", "Content-Length": str(len(body))})
+    try:
+        await response.prepare(request)
+        await write_throttled(response, body, profile["bandwidth"])
+    except (ConnectionError, asyncio.CancelledError):
+        pass
+    return response
+
+
+async def stream_handler(request: web.Request) -> web.StreamResponse:
+    """
+    Serve the endless TS or FLV stream until the client disconnects or the stream duration is reached
+    """
+    profile = get_host_profile(request)
+    flv = request.path.endswith(".flv")
+    response = web.StreamResponse(headers={"Content-Type": "video/x-flv" if flv else "video/mp2t"})
+    body = request.app["segment"]
+    chunk_size = max(int(profile["bandwidth"] * chunk_interval), 1024) if profile["bandwidth"] else len(body)
+    start_time = time()
+    try:
+        await response.prepare(request)
+        if flv:
+            await response.write(get_flv_header())
+        while time() - start_time < stream_duration:
+            if flv:
+                chunk = get_flv_video_tag(chunk_size, int((time() - start_time) * 1000))
+            else:
+                offset = int((time() - start_time) / chunk_interval) * chunk_size % len(body)
+                chunk = body[offset:offset + chunk_size]
+            await response.write(chunk)
+            await asyncio.sleep(chunk_interval if profile["bandwidth"] else 0)
+    except (ConnectionError, asyncio.CancelledError):
+        pass
+    return response
+
+
+async def stats_handler(request: web.Request) -> web.Response:
+    """
+    Get the durations of the url ids, and reset the spans
+    """
+    spans = request.app["spans"]
+    request.app["spans"] = {}
+    return web.json_response({url_id: end - start for url_id, (start, end) in spans.items() if end})
+
+
+def get_origin_app(profiles: dict[str, dict], segment_size: int) -> web.Application:
+    """
+    Get the origin app of the virtual hosts, the profiles are keyed by the address of the host
+    """
+    app = web.Application(middlewares=[profile_middleware])
+    app["profiles"] = profiles
+    app["spans"] = {}
+    app["segment"] = get_ts_segment(segment_size)
+    app.router.add_get("/master.m3u8", master_handler)
+    app.router.add_get("/media.m3u8", media_handler)
+    app.router.add_get("/redirect", redirect_handler)
+    app.router.add_get(r"/seg{index:\d+}.ts", segment_handler)
+    app.router.add_get("/stream.ts", stream_handler)
+    app.router.add_get("/stream.flv", stream_handler)
+    app.router.add_get("/_stats", stats_handler)
+    return app
+
+
+async def hang_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """
+    Accept the connection and never reply, until the client closes it
+    """
+    try:
+        while await reader.read(65536):
+            pass
+    finally:
+        writer.close()
+
+
+async def start_origin(profiles: list[dict], port: int = origin_port, segment_size: int = 1024 * 1024):
+    """
+    Start the origin on the loopback address of each virtual host, the dead hosts either refuse
+    the connection (no listener) or time out (accept and never reply)
+    """
+    alive_profiles = {
+        get_host_address(index): profile for index, profile in enumerate(profiles) if not profile["dead"]
+    }
+    runner = web.AppRunner(get_origin_app(alive_profiles, segment_size), access_log=None)
+    await runner.setup()
+    servers = []
+    for index, profile in enumerate(profiles):
+        address = get_host_address(index)
+        if not profile["dead"]:
+            await web.TCPSite(runner, address, port, backlog=1024).start()
+        elif profile["dead"] == "timeout":
+            servers.append(await asyncio.start_server(hang_connection, address, port))
+    return runner, servers
+
+
+def run_origin(profiles: list[dict], port: int, segment_size: int, ready, stop):
+    """
+    Run the origin in the process until the stop event is set
+    """
+
+    async def main():
+        runner, servers = await start_origin(profiles, port, segment_size)
+        ready.set()
+        while not stop.is_set():
+            await asyncio.sleep(0.2)
+        for server in servers:
+            server.close()
+        await runner.cleanup()
+
+    asyncio.run(main())
@@ -0,0 +1,39 @@
+import json
+import os
+
+import utils.constants as constants
+from utils.config import config
+
+settings_env = "IPTV_API_BENCHMARK_SETTINGS"
+
+
+def apply_settings(settings: dict):
+    """
+    Apply the paths of the output and the overrides of the Settings section
+    """
+    constants.speed_test_log_path = settings["speed_test_log_path"]
+    constants.speed_test_data_path = settings["speed_test_data_path"]
+    for key, value in settings["config"].items():
+        config.set("Settings", key, value)
+
+
+def set_settings(settings: dict):
+    """
+    Apply the settings in this process and pass them to the spawned speed test workers
+    """
+    os.environ[settings_env] = json.dumps(settings)
+    apply_settings(settings)
+
+
+if os.environ.get(settings_env):
+    apply_settings(json.loads(os.environ[settings_env]))
+
+
+def speed_test_worker(*args, **kwargs):
+    """
+    Speed test worker process with the settings of the benchmark, this module is imported by the spawned
+    process to unpickle the target before utils.speed, so the settings are applied instead of the config files
+    """
+    from utils.speed import speed_test_worker as worker
+
+    worker(*args, **kwargs)
@@ -33,7 +33,8 @@ from utils.tools import (
     get_version_info,
     join_url,
     get_urls_len,
-    merge_objects
+    merge_objects,
+    install_uvloop
 )
 from utils.types import CategoryChannelData
 
@@ -58,6 +59,9 @@ class UpdateSource:
         self.stop_event = None
         self.ipv6_support = False
         self.now = None
+        self.partial_result = {}
+        self.last_publish_time = 0
+        self.publish_future = None
 
     async def visit_page(self, channel_names: list[str] = None):
         tasks_config = [
@@ -101,14 +105,53 @@ class UpdateSource:
                 self.tasks.append(task)
                 setattr(self, result_attr, await task)
 
-    def pbar_update(self, name: str = "", item_name: str = ""):
+    def pbar_update(self, name: str = "", item_name: str = "", limit: int = None):
         if self.pbar.n < self.total:
             self.pbar.update()
+            limit_tip = ""
+            if limit:
+                self.pbar.set_postfix(limit=limit, refresh=False)
+                limit_tip = f", 并发数: {limit}"
             self.update_progress(
-                f"正在进行{name}, 剩余{self.total - self.pbar.n}个{item_name}, 预计剩余时间: {get_pbar_remaining(n=self.pbar.n, total=self.total, start_time=self.start_time)}",
+                f"正在进行{name}, 剩余{self.total - self.pbar.n}个{item_name}, 预计剩余时间: {get_pbar_remaining(n=self.pbar.n, total=self.total, start_time=self.start_time)}{limit_tip}",
                 int((self.pbar.n / self.total) * 100),
             )
 
+    def publish_partial_result(self, cate: str, name: str, results: list, first_channel_name: str = None):
+        """
+        Collect the result of the finished channel, and write the finished channels to the result files
+        at the interval of speed_test_publish_interval during the speed test, the sorting and writing run
+        in the executor to keep the event loop testing, and are skipped while the previous one is running
+        """
+        self.partial_result.setdefault(cate, {})[name] = results
+        interval = config.speed_test_publish_interval
+        if not interval or time() - self.last_publish_time < interval * 60:
+            return
+        if self.publish_future and not self.publish_future.done():
+            return
+        self.last_publish_time = time()
+        partial_data = {
+            cate: {name: info_list for name, info_list in obj.items() if name in self.partial_result.get(cate, {})}
+            for cate, obj in self.channel_data.items()
+        }
+        partial_result = {
+            cate: {name: list(result_list) for name, result_list in obj.items()}
+            for cate, obj in self.partial_result.items()
+        }
+        self.publish_future = asyncio.get_running_loop().run_in_executor(
+            None,
+            lambda: write_channel_to_file(
+                sort_channel_result(
+                    partial_data,
+                    result=partial_result,
+                    filter_host=config.speed_test_filter_host,
+                    ipv6_support=self.ipv6_support
+                ),
+                ipv6=self.ipv6_support,
+                first_channel_name=first_channel_name,
+            )
+        )
+
     async def main(self):
         try:
             main_start_time = time()
@@ -151,14 +194,22 @@ class UpdateSource:
                         0,
                     )
                     self.start_time = time()
+                    self.last_publish_time = self.start_time
+                    self.partial_result = {}
                     self.pbar = tqdm(total=self.total, desc="Speed test")
                     test_result = await test_speed(
                         test_data,
                         ipv6=self.ipv6_support,
-                        callback=lambda: self.pbar_update(name="测速", item_name="接口"),
+                        callback=lambda limit: self.pbar_update(name="测速", item_name="接口", limit=limit),
+                        channel_callback=lambda cate, name, results: self.publish_partial_result(
+                            cate, name, results, first_channel_name=channel_names[0]
+                        ),
                     )
                     cache_result = merge_objects(cache_result, test_result, match_key="url")
                     self.pbar.close()
+                    if self.publish_future:
+                        await self.publish_future
+                        self.publish_future = None
                 self.channel_data = sort_channel_result(
                     self.channel_data,
                     result=test_result,
@@ -242,6 +293,7 @@ class UpdateSource:
 if __name__ == "__main__":
     info = get_version_info()
     print(f"✡️ {info['name']} Version: {info['version']}")
+    install_uvloop()
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
     update_source = UpdateSource()
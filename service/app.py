@@ -4,7 +4,7 @@ import sys
 sys.path.append(os.path.dirname(sys.path[0]))
 from flask import Flask, send_from_directory, make_response, jsonify, redirect
 from utils.tools import get_result_file_content, get_ip_address, resource_path, join_url, add_port_to_url, \
-    get_url_without_scheme
+    get_url_without_scheme, format_speed_test_log
 from utils.config import config
 import utils.constants as constants
 from utils.db import get_db_connection, return_db_connection
@@ -193,11 +193,24 @@ def show_log():
     return response
 
 
+def get_readable_log_line(line):
+    """
+    Get the readable line of the speed test log, the JSON lines are formatted as the readable lines
+    """
+    if not line.startswith("{"):
+        return line
+    try:
+        entry = json.loads(line)
+    except json.JSONDecodeError:
+        return line
+    return format_speed_test_log(entry) if "url" in entry else entry.get("message", "")
+
+
 @app.route("/log/speed-test")
-def show_log():
+def show_speed_test_log():
     if os.path.exists(constants.speed_test_log_path):
         with open(constants.speed_test_log_path, "r", encoding="utf-8") as file:
-            content = file.read()
+            content = "\n".join(get_readable_log_line(line.rstrip("\n")) for line in file)
     else:
         content = constants.waiting_tip
     response = make_response(content)
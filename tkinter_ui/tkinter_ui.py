@@ -7,7 +7,7 @@ import tkinter as tk
 from tkinter import messagebox
 from PIL import Image, ImageTk
 from utils.config import config
-from utils.tools import resource_path, get_version_info
+from utils.tools import resource_path, get_version_info, install_uvloop
 from main import UpdateSource
 import asyncio
 import threading
@@ -125,6 +125,7 @@ class TkinterUI:
         if self.now:
             self.update_source.stop()
 
+        install_uvloop()
         loop = asyncio.new_event_loop()
 
         def run_loop():
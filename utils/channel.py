@@ -1,14 +1,16 @@
-import asyncio
 import base64
 import gzip
 import json
+import multiprocessing
 import os
 import pickle
 import re
 from collections import defaultdict
 from logging import INFO
+from time import time
 
 from bs4 import NavigableString
+from tqdm import tqdm
 
 import utils.constants as constants
 from updates.epg.tools import write_to_xml, compress_to_gz
@@ -17,11 +19,23 @@ from utils.config import config
 from utils.db import get_db_connection, return_db_connection
 from utils.ip_checker import IPChecker
 from utils.speed import (
-    get_speed,
     get_speed_result,
     get_sort_result,
-    check_ffmpeg_installed_status,
-    logger as speed_test_logger
+    triage_urls,
+    get_url_hostname,
+    iter_speed_test,
+    iter_speed_test_processes,
+    get_speed_test_bandwidth,
+    probe_udpxy_servers,
+    check_result_qualified,
+    load_speed_cache,
+    check_speed_cached,
+    get_cache_key,
+    get_staleness,
+    get_history_speed,
+    save_speed_cache,
+    start_speed_test_log,
+    stop_speed_test_log
 )
 from utils.tools import (
     format_name,
@@ -39,7 +53,8 @@ from utils.tools import (
     get_ip_address,
     convert_to_m3u,
     custom_print,
-    get_name_uri_from_dir, get_resolution_value
+    get_name_uri_from_dir, get_resolution_value,
+    get_partitioned_list
 )
 from utils.types import ChannelData, OriginType, CategoryChannelData, TestResult
 
@@ -756,54 +771,101 @@ def append_total_data(
             print_channel_number(data, cate, name)
 
 
-async def test_speed(data, ipv6=False, callback=None):
+async def test_speed(data, ipv6=False, callback=None, channel_callback=None):
     """
-    Test speed of channel data
+    Test speed of channel data, the results are grouped as they complete,
+    channel_callback is called with the results of a channel once all its urls are tested
     """
     ipv6_proxy_url = None if (not config.open_ipv6 or ipv6) else constants.ipv6_proxy
-    open_headers = config.open_headers
-    get_resolution = config.open_filter_resolution and check_ffmpeg_installed_status()
-    semaphore = asyncio.Semaphore(config.speed_test_limit)
-
-    async def limited_get_speed(channel_info):
-        """
-        Wrapper for get_speed with rate limiting
-        """
-        async with semaphore:
-            headers = (open_headers and channel_info.get("headers")) or None
-            return await get_speed(
-                channel_info,
-                headers=headers,
-                ipv6_proxy=ipv6_proxy_url,
-                filter_resolution=get_resolution,
-                callback=callback,
+    open_early_stop = config.open_speed_test_early_stop
+    urls_limit = config.urls_limit
+    workers = (config.speed_test_workers or os.cpu_count() or 1) if config.open_speed_test_multiprocess else 1
+    deadline = time() + config.speed_test_deadline * 60 if config.speed_test_deadline else None
+    start_speed_test_log()
+    try:
+        load_speed_cache()
+
+        if config.open_speed_test_triage:
+            triage_urls_list = [
+                info["url"]
+                for channel_obj in data.values()
+                for info_list in channel_obj.values()
+                for info in info_list
+                if not (info["ipv_type"] == "ipv6" and ipv6_proxy_url) and not check_speed_cached(info)
+            ]
+            reachable_count = await triage_urls(triage_urls_list, timeout=config.speed_test_triage_timeout)
+            tqdm.write(f"Reachable urls: {reachable_count}/{len(triage_urls_list)}")
+
+        now = time()
+        channel_keys = [(cate, name) for cate, channel_obj in data.items() for name in channel_obj]
+        names = [name for _, name in channel_keys]
+        test_items = sorted(
+            [
+                (channel_index, info)
+                for channel_index, (cate, name) in enumerate(channel_keys)
+                for info in data[cate][name]
+            ],
+            key=lambda item: get_history_speed(get_cache_key(item[1])) if open_early_stop or deadline
+            else get_staleness(get_cache_key(item[1]), now),
+            reverse=True
+        )
+        test_items = [(index, channel_index, info) for index, (channel_index, info) in enumerate(test_items)]
+        if config.open_speed_test_udpxy_probe:
+            skipped_count = await probe_udpxy_servers(test_items, ipv6_proxy_url, names=names)
+            tqdm.write(f"udpxy server probe, urls skipped: {skipped_count}")
+        cached_count = sum(1 for item in test_items if check_speed_cached(item[2]))
+        tqdm.write(f"Fresh results reused: {cached_count}, need to test: {len(test_items) - cached_count}")
+        bandwidth = await get_speed_test_bandwidth(
+            [info["url"] for _, _, info in test_items if
+             not (info["ipv_type"] == "ipv6" and ipv6_proxy_url) and not check_speed_cached(info)]
+        )
+        if bandwidth:
+            tqdm.write(f"Speed test bandwidth: {bandwidth / 1024 / 1024:.2f} M/s")
+
+        grouped_results = {}
+        channel_remaining = [0] * len(channel_keys)
+        channel_qualified = [0] * len(channel_keys)
+        for _, channel_index, _ in test_items:
+            channel_remaining[channel_index] += 1
+
+        if workers > 1 and len(test_items) > 1:
+            shards = get_partitioned_list(test_items, key=lambda item: get_url_hostname(item[2]["url"]), count=workers)
+            stop_flags = multiprocessing.get_context("spawn").Array("b", len(channel_keys), lock=False)
+            tqdm.write(f"Speed test workers: {len(shards)}")
+            results = iter_speed_test_processes(shards, ipv6_proxy_url, stop_flags, deadline, bandwidth, names)
+        else:
+            stop_flags = [0] * len(channel_keys)
+            results = iter_speed_test(
+                test_items,
+                ipv6_proxy_url,
+                is_stopped=lambda channel_index: stop_flags[channel_index],
+                deadline=deadline,
+                bandwidth=bandwidth,
+                names=names
             )
 
-    tasks = []
-    channel_map = {}
-
-    for cate, channel_obj in data.items():
-        for name, info_list in channel_obj.items():
-            for info in info_list:
-                info['name'] = name
-                task = asyncio.create_task(limited_get_speed(info))
-                tasks.append(task)
-                channel_map[task] = (cate, name, info)
-
-    results = await asyncio.gather(*tasks)
-
-    speed_test_logger.handlers.clear()
-
-    grouped_results = {}
-
-    for task, result in zip(tasks, results):
-        cate, name, info = channel_map[task]
-        if cate not in grouped_results:
-            grouped_results[cate] = {}
-        if name not in grouped_results[cate]:
-            grouped_results[cate][name] = []
-        grouped_results[cate][name].append({**info, **result})
-
+        current_limit = None
+        async for index, result, current_limit in results:
+            _, channel_index, info = test_items[index]
+            cate, name = channel_keys[channel_index]
+            if callback:
+                callback(current_limit)
+            channel_results = grouped_results.setdefault(cate, {}).setdefault(name, [])
+            if result is not None:
+                channel_results.append({**info, **result})
+                if open_early_stop and check_result_qualified(info, result):
+                    channel_qualified[channel_index] += 1
+                    if channel_qualified[channel_index] >= urls_limit:
+                        stop_flags[channel_index] = 1
+            channel_remaining[channel_index] -= 1
+            if channel_remaining[channel_index] == 0 and channel_callback:
+                channel_callback(cate, name, channel_results)
+    finally:
+        save_speed_cache()
+        stop_speed_test_log()
+    if open_early_stop:
+        tqdm.write(f"Channels stopped early: {sum(1 for flag in stop_flags if flag)}")
+    tqdm.write(f"Speed test concurrency limit: {current_limit}")
     return grouped_results
 
 
@@ -915,7 +977,7 @@ def process_write_content(
         )
         now = get_datetime_now()
         update_time_item_url = update_time_item["url"]
-        if open_url_info and update_time_item["extra_info"]:
+        if open_url_info and update_time_item.get("extra_info"):
             update_time_item_url = add_url_info(update_time_item_url, update_time_item["extra_info"])
         value = f"{rtmp_url}{update_time_item["id"]}" if rtmp_url else update_time_item_url
         if config.update_time_position == "top":
@@ -367,6 +367,142 @@ class ConfigManager:
     def speed_test_limit(self):
         return self.config.getint("Settings", "speed_test_limit", fallback=10)
 
+    @property
+    def open_speed_test_multiprocess(self):
+        return self.config.getboolean("Settings", "open_speed_test_multiprocess", fallback=False)
+
+    @property
+    def open_uvloop(self):
+        return self.config.getboolean("Settings", "open_uvloop", fallback=True)
+
+    @property
+    def open_speed_test_force_close(self):
+        return self.config.getboolean("Settings", "open_speed_test_force_close", fallback=False)
+
+    @property
+    def open_speed_test_bandwidth_limit(self):
+        return self.config.getboolean("Settings", "open_speed_test_bandwidth_limit", fallback=False)
+
+    @property
+    def open_speed_test_udpxy_probe(self):
+        return self.config.getboolean("Settings", "open_speed_test_udpxy_probe", fallback=False)
+
+    @property
+    def open_speed_test_log_json(self):
+        return self.config.getboolean("Settings", "open_speed_test_log_json", fallback=False)
+
+    @property
+    def open_speed_test_playback(self):
+        return self.config.getboolean("Settings", "open_speed_test_playback", fallback=False)
+
+    @property
+    def open_speed_test_early_stop(self):
+        return self.config.getboolean("Settings", "open_speed_test_early_stop", fallback=False)
+
+    @property
+    def open_speed_test_adaptive_limit(self):
+        return self.config.getboolean("Settings", "open_speed_test_adaptive_limit", fallback=True)
+
+    @property
+    def speed_test_max_limit(self):
+        return self.config.getint("Settings", "speed_test_max_limit", fallback=100)
+
+    @property
+    def speed_test_min_limit(self):
+        return self.config.getint("Settings", "speed_test_min_limit", fallback=1)
+
+    @property
+    def speed_test_limit_per_host(self):
+        return self.config.getint("Settings", "speed_test_limit_per_host", fallback=4)
+
+    @property
+    def speed_test_limit_per_subnet(self):
+        return self.config.getint("Settings", "speed_test_limit_per_subnet", fallback=0)
+
+    @property
+    def speed_test_sample_size(self):
+        return self.config.getfloat("Settings", "speed_test_sample_size", fallback=2)
+
+    @property
+    def speed_test_sample_tolerance(self):
+        return self.config.getfloat("Settings", "speed_test_sample_tolerance", fallback=5)
+
+    @property
+    def speed_test_udpxy_sample(self):
+        return self.config.getint("Settings", "speed_test_udpxy_sample", fallback=2)
+
+    @property
+    def speed_test_udpxy_max_clients(self):
+        return self.config.getint("Settings", "speed_test_udpxy_max_clients", fallback=3)
+
+    @property
+    def speed_test_log_max_size(self):
+        return self.config.getfloat("Settings", "speed_test_log_max_size", fallback=0)
+
+    @property
+    def speed_test_bandwidth(self):
+        return self.config.getfloat("Settings", "speed_test_bandwidth", fallback=0)
+
+    @property
+    def speed_test_deadline(self):
+        return self.config.getfloat("Settings", "speed_test_deadline", fallback=0)
+
+    @property
+    def speed_test_workers(self):
+        return self.config.getint("Settings", "speed_test_workers", fallback=0)
+
+    @property
+    def speed_test_publish_interval(self):
+        return self.config.getfloat("Settings", "speed_test_publish_interval", fallback=0)
+
+    @property
+    def speed_test_cache_ttl(self):
+        return self.config.getfloat("Settings", "speed_test_cache_ttl", fallback=24)
+
+    @property
+    def speed_test_ffprobe_limit(self):
+        return self.config.getint("Settings", "speed_test_ffprobe_limit", fallback=0) or os.cpu_count() or 4
+
+    @property
+    def speed_test_connector_limit(self):
+        return self.config.getint("Settings", "speed_test_connector_limit", fallback=100)
+
+    @property
+    def speed_test_connector_limit_per_host(self):
+        return self.config.getint("Settings", "speed_test_connector_limit_per_host", fallback=0)
+
+    @property
+    def speed_test_keepalive_timeout(self):
+        return self.config.getfloat("Settings", "speed_test_keepalive_timeout", fallback=15)
+
+    @property
+    def speed_test_happy_eyeballs_delay(self):
+        return self.config.getfloat("Settings", "speed_test_happy_eyeballs_delay", fallback=0.25)
+
+    @property
+    def speed_test_connect_timeout(self):
+        return self.config.getfloat("Settings", "speed_test_connect_timeout", fallback=0)
+
+    @property
+    def speed_test_read_timeout(self):
+        return self.config.getfloat("Settings", "speed_test_read_timeout", fallback=0)
+
+    @property
+    def speed_test_dns_cache_ttl(self):
+        return self.config.getint("Settings", "speed_test_dns_cache_ttl", fallback=300)
+
+    @property
+    def open_speed_test_triage(self):
+        return self.config.getboolean("Settings", "open_speed_test_triage", fallback=True)
+
+    @property
+    def speed_test_triage_timeout(self):
+        return self.config.getfloat("Settings", "speed_test_triage_timeout", fallback=3)
+
+    @property
+    def speed_test_triage_limit(self):
+        return self.config.getint("Settings", "speed_test_triage_limit", fallback=200)
+
     @property
     def location(self):
         return [
@@ -35,6 +35,8 @@ live_ipv6_result_path = os.path.join(output_dir, "ipv6/live.txt")
 
 rtmp_data_path = os.path.join(output_dir, "data/rtmp.db")
 
+speed_test_data_path = os.path.join(output_dir, "data/speed_test.db")
+
 hls_result_path = os.path.join(output_dir, "hls.txt")
 
 hls_ipv4_result_path = os.path.join(output_dir, "ipv4/hls.txt")
@@ -56,6 +58,8 @@ url_pattern = re.compile(
 
 rt_url_pattern = re.compile(r"^(rtmp|rtsp)://.*$")
 
+udpxy_url_pattern = re.compile(r"^https?://(?P<server>[^/]+)/(?:rtp|udp)/.+$", re.IGNORECASE)
+
 rtp_pattern = re.compile(r"^(?P<name>[^,，]+)[,，]?(?P<url>rtp://.*)$")
 
 demo_txt_pattern = re.compile(r"^(?P<name>[^,，]+)[,，]?(?!#genre#)" + r"(" + url_pattern.pattern + r")?")
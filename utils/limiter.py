@@ -0,0 +1,277 @@
+import asyncio
+import heapq
+import ipaddress
+import itertools
+import math
+import time
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limiter, the limit grows while the tests stay healthy
+    and is cut down when the timeout rate or the throughput per test degrades,
+    the baselines follow the results of every window, so a lasting change
+    in the mix of the urls only backs off for a few windows, the limit only grows
+    while the timeout rate is within the error tolerance
+    """
+
+    def __init__(self, limit: int, min_limit: int = 1, max_limit: int = 100, adaptive: bool = True,
+                 backoff: float = 0.75, speed_tolerance: float = 0.3, error_tolerance: float = 0.2):
+        self.min_limit = max(min_limit, 1)
+        self.max_limit = max(max_limit, self.min_limit)
+        self.limit = float(min(max(limit, self.min_limit), self.max_limit))
+        self.adaptive = adaptive
+        self.backoff = backoff
+        self.speed_tolerance = speed_tolerance
+        self.error_tolerance = error_tolerance
+        self.active = 0
+        self.slow_start = True
+        self.speed_baseline = None
+        self.error_baseline = None
+        self._condition = asyncio.Condition()
+        self._speeds = []
+        self._errors = 0
+        self._count = 0
+
+    @property
+    def current_limit(self) -> int:
+        return int(self.limit)
+
+    async def acquire(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.active < self.current_limit)
+            self.active += 1
+
+    async def release(self):
+        async with self._condition:
+            self.active -= 1
+            self._condition.notify_all()
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.release()
+
+    def record(self, speed: float | None, delay: int | float | None, timed_out: bool = False):
+        """
+        Record the result of a finished test, adjust the limit once a window of results is collected,
+        only the timed out failures are counted as errors, the others (refused, not found)
+        do not depend on the concurrency
+        """
+        if not self.adaptive:
+            return
+        self._count += 1
+        if delay is None or delay == -1:
+            self._errors += timed_out
+        elif speed and math.isfinite(speed):
+            self._speeds.append(speed)
+        if self._count >= max(self.current_limit, 5):
+            self._adjust()
+
+    def _adjust(self):
+        error_rate = self._errors / self._count
+        speed = sum(self._speeds) / len(self._speeds) if self._speeds else None
+        degraded = False
+        if self.error_baseline is not None and error_rate > self.error_baseline + self.error_tolerance:
+            degraded = True
+        if speed is not None and self.speed_baseline is not None and speed < self.speed_baseline * (
+                1 - self.speed_tolerance):
+            degraded = True
+        if degraded:
+            self.slow_start = False
+            self.limit = max(self.limit * self.backoff, self.min_limit)
+        elif error_rate <= self.error_tolerance:
+            self.limit = min(self.limit * 2 if self.slow_start else self.limit + 1, self.max_limit)
+        self.error_baseline = error_rate if self.error_baseline is None else (
+                self.error_baseline * 0.8 + error_rate * 0.2)
+        if speed is not None:
+            self.speed_baseline = speed if self.speed_baseline is None else (
+                    self.speed_baseline * 0.8 + speed * 0.2)
+        self._speeds = []
+        self._errors = 0
+        self._count = 0
+
+
+class HostLimiter:
+    """
+    Concurrency limiter by the host of the url, and optionally by the /24 subnet of the IPv4 host
+    """
+
+    def __init__(self, limit_per_host: int = 0, limit_per_subnet: int = 0):
+        self.limit_per_host = limit_per_host
+        self.limit_per_subnet = limit_per_subnet
+        self._semaphores: dict[str, asyncio.Semaphore] = {}
+
+    def _get_semaphore(self, key: str, limit: int) -> asyncio.Semaphore:
+        if key not in self._semaphores:
+            self._semaphores[key] = asyncio.Semaphore(limit)
+        return self._semaphores[key]
+
+    def get_semaphores(self, host: str | None) -> list[asyncio.Semaphore]:
+        """
+        Get the semaphores to acquire for the host, in a fixed order to avoid deadlock
+        """
+        semaphores = []
+        if not host:
+            return semaphores
+        if self.limit_per_subnet > 0:
+            subnet = get_ipv4_subnet(host)
+            if subnet:
+                semaphores.append(self._get_semaphore(f"subnet:{subnet}", self.limit_per_subnet))
+        if self.limit_per_host > 0:
+            semaphores.append(self._get_semaphore(f"host:{host}", self.limit_per_host))
+        return semaphores
+
+    @asynccontextmanager
+    async def limit(self, host: str | None):
+        """
+        Hold the host (and subnet) slots while the context is running
+        """
+        acquired = []
+        try:
+            for semaphore in self.get_semaphores(host):
+                await semaphore.acquire()
+                acquired.append(semaphore)
+            yield
+        finally:
+            for semaphore in reversed(acquired):
+                semaphore.release()
+
+
+def get_ipv4_subnet(host: str) -> str | None:
+    """
+    Get the /24 subnet of the IPv4 host, None if the host is not an IPv4 address
+    """
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return None
+    if address.version != 4:
+        return None
+    return str(ipaddress.ip_network(f"{address}/24", strict=False))
+
+
+class ChannelQueue:
+    """
+    Priority work queue of the items grouped by channel, the channel with the fewest qualified results
+    and then the fewest dispatched items is served first, the items of a channel keep their given order,
+    items of a host that already has limit_per_host items running are held back, a channel without a ready item
+    in its first scan_limit items waits until one of their hosts has an item done
+    """
+
+    def __init__(self, items, channel_key, host_key=None, limit_per_host: int = 0, scan_limit: int = 64):
+        self.channel_key = channel_key
+        self.host_key = host_key
+        self.limit_per_host = limit_per_host
+        self.scan_limit = scan_limit
+        self._items: dict = defaultdict(deque)
+        for item in items:
+            self._items[channel_key(item)].append(item)
+        self._size = sum(len(queue) for queue in self._items.values())
+        self._order = {channel: order for order, channel in enumerate(self._items)}
+        self._qualified = defaultdict(int)
+        self._dispatched = defaultdict(int)
+        self._active = defaultdict(int)
+        self._held: dict = defaultdict(set)
+        self._heap = [(*self._get_key(channel), channel) for channel in self._items]
+        heapq.heapify(self._heap)
+
+    def __len__(self):
+        return self._size
+
+    def _get_key(self, channel):
+        return self._qualified[channel], self._dispatched[channel], self._order[channel]
+
+    def _check_ready(self, item) -> bool:
+        return not (self.limit_per_host and self.host_key) or self._active[
+            self.host_key(item)] < self.limit_per_host
+
+    def _push(self, channel):
+        if self._items[channel]:
+            heapq.heappush(self._heap, (*self._get_key(channel), channel))
+
+    def get(self):
+        """
+        Get the next item to run, the first ready item of the channel is taken if the earlier ones are held back,
+        the channels without a ready item are skipped, None if the queue is empty or no item is ready
+        """
+        while self._heap:
+            entry = heapq.heappop(self._heap)
+            channel = entry[-1]
+            queue = self._items[channel]
+            if not queue or entry[:-1] != self._get_key(channel):
+                continue
+            scanned = list(itertools.islice(queue, self.scan_limit))
+            position = next((i for i, queue_item in enumerate(scanned) if self._check_ready(queue_item)), None)
+            if position is None:
+                for host in {self.host_key(queue_item) for queue_item in scanned}:
+                    self._held[host].add(channel)
+                continue
+            item = queue[position]
+            del queue[position]
+            self._size -= 1
+            self._dispatched[channel] += 1
+            if self.host_key:
+                self._active[self.host_key(item)] += 1
+            self._push(channel)
+            return item
+        return None
+
+    def done(self, item, qualified: bool = False):
+        """
+        Mark the item as done, the channels waiting for its host are queued again,
+        a qualified result moves its channel back in the queue
+        """
+        if self.host_key:
+            host = self.host_key(item)
+            self._active[host] -= 1
+            for channel in self._held.pop(host, ()):
+                self._push(channel)
+        if qualified:
+            channel = self.channel_key(item)
+            self._qualified[channel] += 1
+            self._push(channel)
+
+    def drain(self) -> list:
+        """
+        Remove and return all the remaining items
+        """
+        items = [item for queue in self._items.values() for item in queue]
+        for queue in self._items.values():
+            queue.clear()
+        self._heap = []
+        self._held.clear()
+        self._size = 0
+        return items
+
+
+class BandwidthMeter:
+    """
+    Meter of the download bandwidth (bytes/s) shared by all the downloads,
+    the usage is the ratio of the bandwidth consumed in the last second,
+    the downloads are never paused, so the measured speed is not distorted
+    """
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self._records = deque()
+        self._recent_size = 0
+
+    def record(self, size: int):
+        """
+        Record the downloaded size
+        """
+        now = time.monotonic()
+        self._records.append((now, size))
+        self._recent_size += size
+        while self._records and now - self._records[0][0] > 1:
+            self._recent_size -= self._records.popleft()[1]
+
+    @property
+    def usage(self) -> float:
+        self.record(0)
+        return self._recent_size / self.rate
@@ -1,23 +1,43 @@
 import asyncio
+import codecs
 import http.cookies
 import json
+import math
+import multiprocessing
+import os
 import re
+import shutil
 import subprocess
-from logging import INFO
+from logging import INFO, getLogger
+from logging.handlers import QueueHandler, QueueListener
+from queue import Empty
 from time import time
-from urllib.parse import quote, urljoin
+from urllib.parse import quote, urljoin, urlparse
+from urllib.request import getproxies
 
 import m3u8
-from aiohttp import ClientSession, TCPConnector
+from aiohttp import ClientSession, ClientTimeout, TCPConnector, TraceConfig
 from multidict import CIMultiDictProxy
 
 import utils.constants as constants
 from utils.config import config
-from utils.tools import get_resolution_value, get_logger
+from utils.db import get_db_connection, return_db_connection
+from utils.limiter import AdaptiveLimiter, BandwidthMeter, ChannelQueue, HostLimiter
+from utils.stream import get_rt_result
+from utils.tools import get_resolution_value, get_queue_logger, install_uvloop, EntryFormatter, \
+    format_speed_test_log
 from utils.types import TestResult, ChannelTestResult, TestResultCacheData
+from utils.video import get_resolution_from_bytes
 
 http.cookies._is_legal_key = lambda _: True
 cache: TestResultCacheData = {}
+cache_updated: dict[str, float] = {}
+cache_history: dict[str, tuple[list[TestResult], float]] = {}
+in_flight: dict[str, asyncio.Future] = {}
+redirect_cache: dict[str, tuple[str | None, float]] = {}
+connect_cache: dict[tuple[str, int], int] = {}
+bandwidth_meter: BandwidthMeter | None = None
+log_listener: QueueListener | None = None
 speed_test_timeout = config.speed_test_timeout
 speed_test_filter_host = config.speed_test_filter_host
 open_filter_resolution = config.open_filter_resolution
@@ -26,6 +46,34 @@ max_resolution_value = config.max_resolution_value
 open_supply = config.open_supply
 open_filter_speed = config.open_filter_speed
 min_speed_value = config.min_speed
+speed_test_triage_timeout = config.speed_test_triage_timeout
+speed_test_connect_timeout = config.speed_test_connect_timeout
+speed_test_read_timeout = config.speed_test_read_timeout
+speed_test_sample_size = int(config.speed_test_sample_size * 1024 * 1024)
+speed_test_sample_tolerance = config.speed_test_sample_tolerance / 100
+sample_check_interval = 0.25
+resolution_sample_size = 1024 * 1024
+sample_stable_count = 4
+speed_test_cache_ttl = config.speed_test_cache_ttl * 3600
+cache_history_expire = 7 * 24 * 3600
+cache_sample_size = 5
+borderline_speed_ratio = 0.5
+default_ports = {'http': 80, 'https': 443, 'rtmp': 1935, 'rtsp': 554}
+hls_segment_limit = 5
+default_segment_duration = 6
+open_speed_test_playback = config.open_speed_test_playback
+bandwidth_sample_count = 8
+bandwidth_usage_limit = 0.9
+timed_out_threshold = min(
+    (timeout for timeout in (speed_test_timeout, speed_test_connect_timeout, speed_test_read_timeout) if timeout),
+    default=0
+) * 0.95
+playlist_max_size = 1024 * 1024
+redirect_cache_ttl = speed_test_cache_ttl or 600
+playlist_sniff_size = 64
+m3u8_attribute_pattern = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+udpxy_client_pattern = re.compile(r"<tr[^>]*>\s*<td[^>]*>\s*\d+\s*</td>", re.IGNORECASE)
+text_headers = ['text/html', 'application/json', 'application/xml', 'text/xml']
 m3u8_headers = ['application/x-mpegurl', 'application/vnd.apple.mpegurl', 'audio/mpegurl', 'audio/x-mpegurl']
 default_ipv6_delay = 0.1
 default_ipv6_resolution = "1920x1080"
@@ -34,66 +82,318 @@ default_ipv6_result = {
     'delay': default_ipv6_delay,
     'resolution': default_ipv6_resolution
 }
-logger = get_logger(constants.speed_test_log_path, level=INFO, init=True)
+logger = getLogger(constants.speed_test_log_path)
 
 
-async def get_speed_with_download(url: str, headers: dict = None, session: ClientSession = None,
-                                  timeout: int = speed_test_timeout) -> dict[
-    str, float | None]:
+def get_connector_limit(concurrency: int = None) -> int:
+    """
+    Get the connection limit of the speed test session, the pool holds at least the segments
+    downloaded in parallel by the concurrent tests, so the requests do not wait for a connection
+    during the measured time, 0 means no limit
+    """
+    if not config.speed_test_connector_limit:
+        return 0
+    if concurrency is None:
+        concurrency = config.speed_test_max_limit if config.open_speed_test_adaptive_limit else config.speed_test_limit
+    return max(config.speed_test_connector_limit, concurrency * hls_segment_limit)
+
+
+def get_speed_test_session(concurrency: int = None) -> ClientSession:
+    """
+    Get the speed test session, the connector pool and dns cache are shared by all the requests of the session,
+    the pool is sized by the concurrency of the tests
+    """
+    force_close = config.open_speed_test_force_close
+    connector = TCPConnector(
+        ssl=False,
+        limit=get_connector_limit(concurrency),
+        limit_per_host=config.speed_test_connector_limit_per_host,
+        ttl_dns_cache=config.speed_test_dns_cache_ttl or None,
+        use_dns_cache=config.speed_test_dns_cache_ttl > 0,
+        force_close=force_close,
+        happy_eyeballs_delay=config.speed_test_happy_eyeballs_delay or None,
+        **({} if force_close else {'keepalive_timeout': config.speed_test_keepalive_timeout}),
+    )
+    return ClientSession(
+        connector=connector, timeout=get_client_timeout(), trust_env=True, trace_configs=[get_trace_config()]
+    )
+
+
+def get_trace_config() -> TraceConfig:
+    """
+    Get the trace config recording the timing (ms) of the request to the dict passed as the trace request context,
+    the dns resolve and the connect time of the redirects are added up, the connect time excludes the dns resolve,
+    the ttfb is the time until the headers of the final response
+    """
+    trace_config = TraceConfig()
+
+    async def on_request_start(session, context, params):
+        context.start_time = time()
+
+    async def on_dns_resolvehost_start(session, context, params):
+        context.dns_start_time = time()
+
+    async def on_dns_resolvehost_end(session, context, params):
+        if context.trace_request_ctx is not None:
+            context.trace_request_ctx['dns'] += int(round((time() - context.dns_start_time) * 1000))
+
+    async def on_connection_create_start(session, context, params):
+        context.connect_start_time = time()
+        context.connect_start_dns = context.trace_request_ctx['dns'] if context.trace_request_ctx is not None else 0
+
+    async def on_connection_create_end(session, context, params):
+        if context.trace_request_ctx is not None:
+            timing = context.trace_request_ctx
+            timing['connect'] += int(round((time() - context.connect_start_time) * 1000)) - (
+                    timing['dns'] - context.connect_start_dns)
+
+    async def on_request_end(session, context, params):
+        if context.trace_request_ctx is not None:
+            context.trace_request_ctx['ttfb'] = int(round((time() - context.start_time) * 1000))
+
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_dns_resolvehost_start.append(on_dns_resolvehost_start)
+    trace_config.on_dns_resolvehost_end.append(on_dns_resolvehost_end)
+    trace_config.on_connection_create_start.append(on_connection_create_start)
+    trace_config.on_connection_create_end.append(on_connection_create_end)
+    trace_config.on_request_end.append(on_request_end)
+    return trace_config
+
+
+def get_timing() -> dict[str, int]:
+    """
+    Get the empty timing (ms) of the request
+    """
+    return {'dns': 0, 'connect': 0, 'ttfb': 0, 'transfer': 0}
+
+
+def get_client_timeout(total: int | float = speed_test_timeout) -> ClientTimeout:
+    """
+    Get the timeout of the speed test request, with the connect and read timeouts within the total timeout
+    """
+    return ClientTimeout(
+        total=total,
+        connect=speed_test_connect_timeout or None,
+        sock_read=speed_test_read_timeout or None
+    )
+
+
+def get_url_address(url: str) -> tuple[str, int] | None:
+    """
+    Get the (host, port) address of the url
+    """
+    try:
+        parsed = urlparse(url)
+        port = parsed.port or default_ports.get(parsed.scheme)
+        if parsed.hostname and port:
+            return parsed.hostname, port
+    except ValueError:
+        pass
+    return None
+
+
+async def get_connect_delay(address: tuple[str, int], timeout: float = speed_test_triage_timeout) -> int:
     """
-    Get the speed of the url with a total timeout
+    Get the tcp connect delay of the address, -1 means unreachable
     """
     start_time = time()
-    delay = -1
-    total_size = 0
-    if session is None:
-        session = ClientSession(connector=TCPConnector(ssl=False), trust_env=True)
-        created_session = True
-    else:
-        created_session = False
+    writer = None
     try:
-        async with session.get(url, headers=headers, timeout=timeout) as response:
-            if response.status != 200:
-                raise Exception("Invalid response")
-            delay = int(round((time() - start_time) * 1000))
-            async for chunk in response.content.iter_any():
-                if chunk:
-                    total_size += len(chunk)
+        _, writer = await asyncio.wait_for(asyncio.open_connection(*address), timeout)
+        return int(round((time() - start_time) * 1000))
     except:
-        pass
+        return -1
     finally:
-        total_time = time() - start_time
-        if created_session:
-            await session.close()
-        return {
-            'speed': total_size / total_time / 1024 / 1024,
-            'delay': delay,
-            'size': total_size,
-            'time': total_time,
-        }
+        if writer:
+            writer.close()
+
+
+async def triage_urls(urls: list[str], timeout: float = speed_test_triage_timeout,
+                      limit: int = config.speed_test_triage_limit) -> int:
+    """
+    Probe the addresses of the urls with a tcp connect before the speed test,
+    the urls of the unreachable addresses will skip the full test, return the number of the reachable urls
+    """
+    connect_cache.clear()
+    if getproxies():
+        return len(urls)
+    url_addresses = {url: get_url_address(url) for url in urls}
+    addresses = {address for address in url_addresses.values() if address}
+    semaphore = asyncio.Semaphore(limit)
+
+    async def limited_get_connect_delay(address):
+        async with semaphore:
+            connect_cache[address] = await get_connect_delay(address, timeout)
+
+    await asyncio.gather(*(limited_get_connect_delay(address) for address in addresses))
+    return sum(1 for address in url_addresses.values() if connect_cache.get(address, 0) != -1)
+
+
+def get_url_hostname(url: str) -> str | None:
+    """
+    Get the hostname of the url
+    """
+    address = get_url_address(url)
+    return address[0] if address else None
+
+
+def check_url_reachable(url: str) -> bool:
+    """
+    Check if the url is reachable by the triage result
+    """
+    return connect_cache.get(get_url_address(url)) != -1
+
+
+def check_speed_stable(estimates: list[float], tolerance: float = speed_test_sample_tolerance) -> bool:
+    """
+    Check if the latest speed estimates are stable within the tolerance ratio
+    """
+    if len(estimates) < sample_stable_count:
+        return False
+    recent = estimates[-sample_stable_count:]
+    mean = sum(recent) / len(recent)
+    return mean > 0 and (max(recent) - min(recent)) / mean <= tolerance
+
+
+async def download_sample(response, result: dict, content_size: int = 0,
+                          sample_size: int = speed_test_sample_size,
+                          sample_tolerance: float = speed_test_sample_tolerance, head: bytes = b''):
+    """
+    Download the response into the result size and content,
+    until the sample size is reached or the speed estimate is stable,
+    the first content_size bytes are kept in the content for the resolution parsing,
+    the downloaded size is recorded to the bandwidth meter
+    """
+    content = result['content']
+    first_byte_time = check_time = time() if head else None
+    estimates = []
+    chunk = head
+    chunks = response.content.iter_any()
+    while True:
+        if chunk:
+            if bandwidth_meter:
+                bandwidth_meter.record(len(chunk))
+            result['size'] += len(chunk)
+            if len(content) < content_size:
+                content += chunk[:content_size - len(content)]
+            if sample_size and result['size'] >= sample_size:
+                break
+            if sample_tolerance:
+                now = time()
+                if first_byte_time is None:
+                    first_byte_time = check_time = now
+                elif now - check_time >= sample_check_interval:
+                    check_time = now
+                    estimates.append(result['size'] / max(now - first_byte_time, 1e-3))
+                    if check_speed_stable(estimates, sample_tolerance):
+                        break
+        chunk = await anext(chunks, None)
+        if chunk is None:
+            break
 
 
-async def get_headers(url: str, headers: dict = None, session: ClientSession = None, timeout: int = 5) -> \
-        CIMultiDictProxy[str] | dict[
-            any, any]:
+def get_download_result(result: dict, start_time: float) -> dict:
     """
-    Get the headers of the url
+    Get the speed of the download result
     """
+    total_time = time() - start_time
+    return {
+        **result,
+        'speed': result['size'] / total_time / 1024 / 1024 if total_time > 0 else 0,
+        'time': total_time,
+        'content': bytes(result['content']),
+    }
+
+
+async def get_speed_with_download(url: str, headers: dict = None, session: ClientSession = None,
+                                  timeout: int = speed_test_timeout, sample_size: int = speed_test_sample_size,
+                                  sample_tolerance: float = speed_test_sample_tolerance, content_size: int = 0) -> dict[
+    str, float | bytes | None]:
+    """
+    Get the speed of the url with a total timeout,
+    the download stops early once the sample size is reached or the speed estimate is stable,
+    the first content_size bytes are kept in the result for the resolution parsing
+    """
+    start_time = time()
+    result = {'delay': -1, 'size': 0, 'content': bytearray()}
     if session is None:
-        session = ClientSession(connector=TCPConnector(ssl=False), trust_env=True)
+        session = get_speed_test_session()
         created_session = True
     else:
         created_session = False
-    res_headers = {}
     try:
-        async with session.head(url, headers=headers, timeout=timeout) as response:
-            res_headers = response.headers
+        async with session.get(url, headers=headers, timeout=get_client_timeout(timeout)) as response:
+            if response.status != 200:
+                raise Exception("Invalid response")
+            result['delay'] = int(round((time() - start_time) * 1000))
+            await download_sample(response, result, content_size, sample_size, sample_tolerance)
     except:
         pass
     finally:
         if created_session:
             await session.close()
-        return res_headers
+        return get_download_result(result, start_time)
+
+
+def get_redirect_target(url: str) -> str | None:
+    """
+    Get the cached redirect target of the url, the failed targets are kept as None until saved
+    """
+    target = redirect_cache.get(url)
+    if target and time() - target[1] < redirect_cache_ttl:
+        return target[0]
+    return None
+
+
+async def get_stream_info(url: str, headers: dict = None, session: ClientSession = None,
+                          timeout: int = speed_test_timeout, content_size: int = 0) -> dict[str, any]:
+    """
+    Get the stream info of the url with a single GET request, the redirects are followed in the session
+    and the resolved target is cached across the runs, the headers and the beginning of the body decide
+    if it is a playlist read as text or a raw stream downloaded to test the speed,
+    the timing of the request is traced by the session
+    """
+    target = get_redirect_target(url)
+    start_time = time()
+    result = {}
+    for request_url in ([target, url] if target else [url]):
+        start_time = time()
+        result = {'url': request_url, 'playlist': None, 'delay': -1, 'size': 0, 'content': bytearray(),
+                  'timing': get_timing()}
+        try:
+            async with session.get(request_url, headers=headers, timeout=get_client_timeout(timeout),
+                                   trace_request_ctx=result['timing']) as response:
+                if response.status != 200:
+                    raise Exception("Invalid response")
+                result['delay'] = int(round((time() - start_time) * 1000))
+                result['url'] = str(response.url)
+                if response.history:
+                    redirect_cache[url] = (result['url'], time())
+                head = bytearray()
+                while len(head) < playlist_sniff_size and (chunk := await response.content.readany()):
+                    head += chunk
+                head = bytes(head)
+                if check_m3u8_valid(response.headers) or head.removeprefix(codecs.BOM_UTF8).lstrip().startswith(
+                        b'#EXTM3U'):
+                    body = bytearray(head)
+                    async for chunk in response.content.iter_any():
+                        body += chunk
+                        if len(body) >= playlist_max_size:
+                            break
+                    result['playlist'] = body.decode('utf-8-sig', 'ignore')
+                elif any(item in response.headers.get('Content-Type', '').lower() for item in text_headers):
+                    result['delay'] = -1
+                    raise Exception("Invalid content")
+                else:
+                    await download_sample(response, result, content_size, head=head)
+                result['timing']['transfer'] = int(round((time() - start_time) * 1000)) - result['timing']['ttfb']
+        except:
+            pass
+        if result['delay'] != -1:
+            break
+        if url in redirect_cache:
+            redirect_cache[url] = (None, time())
+    return get_download_result(result, start_time)
 
 
 async def get_url_content(url: str, headers: dict = None, session: ClientSession = None,
@@ -102,15 +402,15 @@ async def get_url_content(url: str, headers: dict = None, session: ClientSession
     Get the content of the url
     """
     if session is None:
-        session = ClientSession(connector=TCPConnector(ssl=False), trust_env=True)
+        session = get_speed_test_session()
         created_session = True
     else:
         created_session = False
     content = ""
     try:
-        async with session.get(url, headers=headers, timeout=timeout) as response:
+        async with session.get(url, headers=headers, timeout=get_client_timeout(timeout)) as response:
             if response.status == 200:
-                content = await response.text()
+                content = (await response.text()).removeprefix('\ufeff')
             else:
                 raise Exception("Invalid response")
     except:
@@ -131,54 +431,194 @@ def check_m3u8_valid(headers: CIMultiDictProxy[str] | dict[any, any]) -> bool:
     return any(item in content_type for item in m3u8_headers)
 
 
+def get_m3u8_attributes(content: str) -> dict[str, str]:
+    """
+    Get the attributes of the m3u8 tag
+    """
+    return {key: value.strip('"') for key, value in m3u8_attribute_pattern.findall(content)}
+
+
+def scan_m3u8(content: str, segment_limit: int = hls_segment_limit) -> dict[str, list] | None:
+    """
+    Scan the m3u8 content for the variant streams, the target duration and the first segment uris with
+    their durations, None if the playlist is unusual and needs to be parsed by the m3u8 library
+    """
+    playlists = []
+    segments = []
+    durations = []
+    target_duration = None
+    duration = None
+    stream_info = None
+    lines = (line.strip() for line in content.splitlines())
+    if next((line for line in lines if line), None) != '#EXTM3U':
+        return None
+    for line in lines:
+        if not line:
+            continue
+        if line.startswith('#EXT-X-STREAM-INF:'):
+            stream_info = get_m3u8_attributes(line[18:])
+        elif line.startswith('#EXT-X-BYTERANGE'):
+            return None
+        elif line.startswith('#EXT-X-TARGETDURATION:'):
+            target_duration = float(line[22:] or 0) or None
+        elif line.startswith('#EXTINF:'):
+            duration = float(line[8:].partition(',')[0] or 0) or None
+        elif line.startswith('#'):
+            continue
+        elif stream_info is not None:
+            playlists.append({
+                'uri': line,
+                'bandwidth': int(stream_info.get('BANDWIDTH') or 0),
+                'resolution': stream_info.get('RESOLUTION')
+            })
+            stream_info = None
+        elif not playlists:
+            segments.append(line)
+            durations.append(duration)
+            duration = None
+            if len(segments) >= segment_limit:
+                break
+    return {'playlists': playlists, 'segments': segments, 'durations': durations, 'target_duration': target_duration}
+
+
+def load_m3u8(content: str, segment_limit: int = hls_segment_limit) -> dict[str, list]:
+    """
+    Load the m3u8 content by the m3u8 library, in the same format as scan_m3u8
+    """
+    m3u8_obj = m3u8.loads(content)
+    return {
+        'playlists': [
+            {
+                'uri': playlist.uri,
+                'bandwidth': playlist.stream_info.bandwidth or 0,
+                'resolution': 'x'.join(map(str, playlist.stream_info.resolution))
+                if playlist.stream_info.resolution else None
+            }
+            for playlist in m3u8_obj.playlists
+        ],
+        'segments': [segment.uri for segment in m3u8_obj.segments[:segment_limit]],
+        'durations': [segment.duration or None for segment in m3u8_obj.segments[:segment_limit]],
+        'target_duration': m3u8_obj.target_duration or None
+    }
+
+
+async def get_playback_result(segment_urls: list[str], durations: list[float | None], target_duration: float | None,
+                              bandwidth: int = 0, headers: dict = None, session: ClientSession = None,
+                              timeout: int = speed_test_timeout, content_size: int = 0) -> dict[str, any]:
+    """
+    Simulate the playback of the segments, they are downloaded one by one at the pace of the target duration
+    within the timeout, the playback starts with the first segment and a target duration of buffer,
+    a stall is counted when a segment is not downloaded before it is due to play, the sustain ratio is the download rate against the
+    bitrate of the stream, which is the bandwidth of the variant or estimated from the segment sizes
+    """
+    result = {'speed': 0, 'delay': -1, 'sustain': 0, 'stalls': 0, 'content': None}
+    target_duration = target_duration or default_segment_duration
+    start_time = time()
+    play_time = None
+    total_size = total_time = total_duration = 0
+    for i, ts_url in enumerate(segment_urls):
+        fetch_time = start_time + i * target_duration
+        if i and fetch_time >= start_time + timeout:
+            break
+        if fetch_time > time():
+            await asyncio.sleep(fetch_time - time())
+        segment = await get_speed_with_download(
+            ts_url, headers, session, start_time + timeout - time(), sample_size=0, sample_tolerance=0,
+            content_size=content_size if i == 0 else 0
+        )
+        finish_time = time()
+        if segment['delay'] == -1:
+            result['stalls'] += 1
+            break
+        if i == 0:
+            result['delay'] = int(round((finish_time - start_time) * 1000))
+            result['content'] = segment['content']
+            play_time = finish_time + target_duration
+        elif finish_time > play_time:
+            result['stalls'] += 1
+            play_time = finish_time
+        play_time += durations[i] or target_duration
+        total_size += segment['size']
+        total_time += segment['time']
+        total_duration += durations[i] or target_duration
+    if total_time > 0:
+        result['speed'] = total_size / total_time / 1024 / 1024
+        bitrate = bandwidth / 8 if bandwidth else total_size / total_duration
+        result['sustain'] = round(total_size / total_time / bitrate, 2) if bitrate else 0
+    return result
+
+
 async def get_result(url: str, headers: dict = None, resolution: str = None,
                      filter_resolution: bool = config.open_filter_resolution,
-                     timeout: int = speed_test_timeout) -> dict[str, float | None]:
+                     timeout: int = speed_test_timeout, session: ClientSession = None) -> dict[str, float | None]:
     """
     Get the test result of the url
     """
     info = {'speed': 0, 'delay': -1, 'resolution': resolution}
-    location = None
+    content = None
+    content_size = resolution_sample_size if not resolution and filter_resolution else 0
+    if session is None:
+        session = get_speed_test_session()
+        created_session = True
+    else:
+        created_session = False
     try:
         url = quote(url, safe=':/?$&=@[]%').partition('$')[0]
-        async with ClientSession(connector=TCPConnector(ssl=False), trust_env=True) as session:
-            res_headers = await get_headers(url, headers, session)
-            location = res_headers.get('Location')
-            if location:
-                info.update(await get_result(location, headers, resolution, filter_resolution, timeout))
-            else:
-                url_content = await get_url_content(url, headers, session, timeout)
-                if url_content:
-                    m3u8_obj = m3u8.loads(url_content)
-                    playlists = m3u8_obj.playlists
-                    segments = m3u8_obj.segments
-                    if playlists:
-                        best_playlist = max(m3u8_obj.playlists, key=lambda p: p.stream_info.bandwidth)
-                        playlist_url = urljoin(url, best_playlist.uri)
-                        playlist_content = await get_url_content(playlist_url, headers, session, timeout)
-                        if playlist_content:
-                            media_playlist = m3u8.loads(playlist_content)
-                            segment_urls = [urljoin(playlist_url, segment.uri) for segment in media_playlist.segments]
-                    else:
-                        segment_urls = [urljoin(url, segment.uri) for segment in segments]
-                    if not segment_urls:
-                        raise Exception("Segment urls not found")
-                else:
-                    res_info = await get_speed_with_download(url, headers, session, timeout)
-                    info.update({'speed': res_info['speed'], 'delay': res_info['delay']})
-                    raise Exception("No url content, use download with timeout to test")
-                start_time = time()
-                tasks = [get_speed_with_download(ts_url, headers, session, timeout) for ts_url in segment_urls[:5]]
-                results = await asyncio.gather(*tasks, return_exceptions=True)
-                total_size = sum(result['size'] for result in results if isinstance(result, dict))
-                total_time = sum(result['time'] for result in results if isinstance(result, dict))
-                info['speed'] = total_size / total_time / 1024 / 1024 if total_time > 0 else 0
-                info['delay'] = int(round((time() - start_time) * 1000))
+        stream_info = await get_stream_info(url, headers, session, timeout, content_size)
+        info['timing'] = stream_info['timing']
+        if stream_info['playlist'] is None:
+            info.update({'speed': stream_info['speed'], 'delay': stream_info['delay']})
+            content = stream_info['content']
+            raise Exception("Not a playlist, use download with timeout to test")
+        url = stream_info['url']
+        m3u8_info = scan_m3u8(stream_info['playlist']) or load_m3u8(stream_info['playlist'])
+        segment_urls = []
+        bandwidth = 0
+        if m3u8_info['playlists']:
+            best_playlist = max(m3u8_info['playlists'], key=lambda p: p['bandwidth'])
+            bandwidth = best_playlist['bandwidth']
+            if best_playlist['resolution'] and not info['resolution'] and filter_resolution:
+                info['resolution'] = best_playlist['resolution']
+                content_size = 0
+            playlist_url = urljoin(url, best_playlist['uri'])
+            playlist_content = await get_url_content(playlist_url, headers, session, timeout)
+            if playlist_content:
+                m3u8_info = scan_m3u8(playlist_content) or load_m3u8(playlist_content)
+                segment_urls = [urljoin(playlist_url, uri) for uri in m3u8_info['segments']]
+        else:
+            segment_urls = [urljoin(url, uri) for uri in m3u8_info['segments']]
+        if not segment_urls:
+            raise Exception("Segment urls not found")
+        start_time = time()
+        if open_speed_test_playback:
+            playback_result = await get_playback_result(
+                segment_urls, m3u8_info['durations'], m3u8_info['target_duration'], bandwidth, headers, session,
+                timeout, content_size
+            )
+            content = playback_result.pop('content')
+            info.update(playback_result)
+            info['timing']['transfer'] = int(round((time() - start_time) * 1000))
+            raise Exception("Playback simulated, skip the parallel download")
+        tasks = [
+            get_speed_with_download(ts_url, headers, session, timeout, content_size=content_size if i == 0 else 0)
+            for i, ts_url in enumerate(segment_urls[:hls_segment_limit])
+        ]
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        if isinstance(results[0], dict):
+            content = results[0]['content']
+        total_size = sum(result['size'] for result in results if isinstance(result, dict))
+        total_time = sum(result['time'] for result in results if isinstance(result, dict))
+        info['speed'] = total_size / total_time / 1024 / 1024 if total_time > 0 else 0
+        info['delay'] = int(round((time() - start_time) * 1000))
+        info['timing']['transfer'] = info['delay']
     except:
         pass
     finally:
-        if not resolution and filter_resolution and not location and info['delay'] != -1:
-            info['resolution'] = await get_resolution_ffprobe(url, headers, timeout)
+        if created_session:
+            await session.close()
+        if not info['resolution'] and filter_resolution and info['delay'] != -1:
+            info['resolution'] = get_resolution_from_bytes(content) or await get_resolution_ffprobe(
+                url, headers, timeout, content)
         return info
 
 
@@ -254,34 +694,111 @@ async def ffmpeg_url(url, timeout=speed_test_timeout):
         return res
 
 
-async def get_resolution_ffprobe(url: str, headers: dict = None, timeout: int = speed_test_timeout) -> str | None:
+class FFprobePool:
+    """
+    Bounded ffprobe process pool with a circuit breaker,
+    the breaker opens when ffprobe is missing or keeps timing out,
+    the semaphore is created for each event loop, as every run of the update may start a new loop
     """
-    Get the resolution of the url by ffprobe
+
+    def __init__(self, limit: int, failure_threshold: int = 5, cooldown: int = 60):
+        self.limit = limit
+        self._semaphore = None
+        self._loop = None
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.open_until = 0
+        self.installed = None
+
+    def available(self) -> bool:
+        """
+        Check if ffprobe can be used now
+        """
+        if self.installed is None:
+            self.installed = shutil.which('ffprobe') is not None
+        return self.installed and time() >= self.open_until
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            self.open_until = time() + self.cooldown
+            self.failures = 0
+
+    def record_success(self):
+        self.failures = 0
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.limit)
+            self._loop = loop
+        return self._semaphore
+
+    async def run(self, args: list[str], input_data: bytes = None, timeout: int = speed_test_timeout) -> bytes | None:
+        """
+        Run ffprobe with the args in the pool, return the stdout
+        """
+        if not self.available():
+            return None
+        async with self.semaphore:
+            if not self.available():
+                return None
+            proc = None
+            try:
+                proc = await asyncio.create_subprocess_exec(
+                    'ffprobe', *args,
+                    stdin=asyncio.subprocess.PIPE if input_data else asyncio.subprocess.DEVNULL,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.DEVNULL
+                )
+                out, _ = await asyncio.wait_for(proc.communicate(input_data), timeout)
+                self.record_success()
+                return out
+            except FileNotFoundError:
+                self.installed = False
+            except (asyncio.TimeoutError, OSError):
+                self.record_failure()
+            except:
+                pass
+            finally:
+                if proc and proc.returncode is None:
+                    proc.kill()
+                    await proc.wait()
+            return None
+
+
+ffprobe_pool = FFprobePool(config.speed_test_ffprobe_limit)
+
+
+async def get_resolution_ffprobe(url: str, headers: dict = None, timeout: int = speed_test_timeout,
+                                 content: bytes = None) -> str | None:
+    """
+    Get the resolution of the url by ffprobe, the downloaded content is piped to ffprobe if provided
     """
     resolution = None
-    proc = None
     try:
         probe_args = [
-            'ffprobe',
             '-v', 'error',
-            '-headers', ''.join(f'{k}: {v}\r\n' for k, v in headers.items()) if headers else '',
             '-select_streams', 'v:0',
             '-show_entries', 'stream=width,height',
             "-of", 'json',
-            url
         ]
-        proc = await asyncio.create_subprocess_exec(*probe_args, stdout=asyncio.subprocess.PIPE,
-                                                    stderr=asyncio.subprocess.PIPE)
-        out, _ = await asyncio.wait_for(proc.communicate(), timeout)
-        video_stream = json.loads(out.decode('utf-8'))["streams"][0]
-        resolution = f"{video_stream['width']}x{video_stream['height']}"
+        if content:
+            probe_args += ['-i', 'pipe:0']
+        else:
+            probe_args += [
+                '-headers', ''.join(f'{k}: {v}\r\n' for k, v in headers.items()) if headers else '',
+                url
+            ]
+        out = await ffprobe_pool.run(probe_args, content, timeout)
+        if out:
+            video_stream = json.loads(out.decode('utf-8'))["streams"][0]
+            resolution = f"{video_stream['width']}x{video_stream['height']}"
     except:
-        if proc:
-            proc.kill()
-    finally:
-        if proc:
-            await proc.wait()
-        return resolution
+        pass
+    return resolution
 
 
 def get_video_info(video_info):
@@ -321,12 +838,20 @@ async def check_stream_delay(url_info):
 
 
 def get_avg_result(result) -> TestResult:
-    return {
+    avg_result = {
         'speed': sum(item['speed'] or 0 for item in result) / len(result),
         'delay': max(
             int(sum(item['delay'] or -1 for item in result) / len(result)), -1),
         'resolution': max((item['resolution'] for item in result), key=get_resolution_value)
     }
+    playback = [item for item in result if item.get('sustain') is not None]
+    if playback:
+        avg_result['sustain'] = round(sum(item['sustain'] for item in playback) / len(playback), 2)
+        avg_result['stalls'] = max(item['stalls'] for item in playback)
+    timing = next((item['timing'] for item in reversed(result) if item.get('timing')), None)
+    if timing:
+        avg_result['timing'] = timing
+    return avg_result
 
 
 def get_speed_result(key: str) -> TestResult:
@@ -339,41 +864,558 @@ def get_speed_result(key: str) -> TestResult:
         return {'speed': 0, 'delay': -1, 'resolution': 0}
 
 
-async def get_speed(data, headers=None, ipv6_proxy=None, filter_resolution=open_filter_resolution,
-                    timeout=speed_test_timeout, callback=None) -> TestResult:
+def get_cache_key(data) -> str | None:
+    """
+    Get the cache key of the channel data, the host is used when filtering by host
+    """
+    return data['host'] if speed_test_filter_host else data['url']
+
+
+def check_speed_cached(data) -> bool:
+    """
+    Check if the channel data has a speed result in the cache
     """
-    Get the speed (response time and resolution) of the url
+    return get_cache_key(data) in cache
+
+
+def get_result_ttl(samples: list[TestResult], ttl: int | float = speed_test_cache_ttl,
+                   min_speed: float = min_speed_value) -> float:
+    """
+    Get the freshness budget of the result samples, failed and borderline results are always stale,
+    the budget of the healthy results is cut down by the variation of the samples
+    """
+    speeds = [item['speed'] or 0 for item in samples]
+    if not speeds or min(speeds) <= 0 or get_avg_result(samples)['delay'] == -1:
+        return 0
+    avg_speed = sum(speeds) / len(speeds)
+    if avg_speed < min_speed * (1 + borderline_speed_ratio):
+        return 0
+    if not math.isfinite(avg_speed):
+        return ttl
+    variation = (sum((speed - avg_speed) ** 2 for speed in speeds) / len(speeds)) ** 0.5 / avg_speed
+    return ttl / (1 + variation)
+
+
+def get_staleness(key: str, now: float = None) -> float:
+    """
+    Get the staleness of the result of the key, results without history or freshness budget are the most stale
+    """
+    if key not in cache_history:
+        return float("inf")
+    samples, updated_at = cache_history[key]
+    result_ttl = get_result_ttl(samples)
+    if result_ttl <= 0:
+        return float("inf")
+    return ((now or time()) - updated_at) / result_ttl
+
+
+def get_history_speed(key: str) -> float:
+    """
+    Get the average speed of the history of the key, results without history are ranked at the minimum speed
+    """
+    if key not in cache_history:
+        return min_speed_value
+    return get_avg_result(cache_history[key][0])['speed']
+
+
+def load_speed_cache(ttl: int | float = speed_test_cache_ttl):
+    """
+    Reset the speed result cache, load the history and the redirect targets of the speed test store,
+    the results within their freshness budget are reused without testing again
+    """
+    cache.clear()
+    cache_updated.clear()
+    cache_history.clear()
+    if ttl <= 0 or not os.path.exists(constants.speed_test_data_path):
+        return
+    conn = get_db_connection(constants.speed_test_data_path)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            "CREATE TABLE IF NOT EXISTS speed_result (key TEXT PRIMARY KEY, samples TEXT, updated_at REAL)"
+        )
+        now = time()
+        cursor.execute("DELETE FROM speed_result WHERE updated_at < ?", (now - max(ttl, cache_history_expire),))
+        conn.commit()
+        cursor.execute("SELECT key, samples, updated_at FROM speed_result")
+        for key, samples, updated_at in cursor.fetchall():
+            samples = json.loads(samples)
+            cache_history[key] = (samples, updated_at)
+            if now - updated_at < get_result_ttl(samples, ttl):
+                cache[key] = samples
+        cursor.execute(
+            "CREATE TABLE IF NOT EXISTS redirect_target (url TEXT PRIMARY KEY, target TEXT, updated_at REAL)"
+        )
+        cursor.execute("DELETE FROM redirect_target WHERE updated_at < ?", (now - redirect_cache_ttl,))
+        conn.commit()
+        cursor.execute("SELECT url, target, updated_at FROM redirect_target")
+        for url, target, updated_at in cursor.fetchall():
+            if url not in redirect_cache:
+                redirect_cache[url] = (target, updated_at)
+    except Exception as e:
+        print(f"❌ Error loading speed test data: {e}")
+    finally:
+        return_db_connection(constants.speed_test_data_path, conn)
+
+
+def save_speed_cache(ttl: int | float = speed_test_cache_ttl):
+    """
+    Save the results tested in this run to the speed test store, with the recent samples of the history,
+    and the redirect targets, the failed targets are removed
+    """
+    if ttl <= 0 or not (cache_updated or redirect_cache):
+        return
+    os.makedirs(os.path.dirname(constants.speed_test_data_path), exist_ok=True)
+    conn = get_db_connection(constants.speed_test_data_path)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            "CREATE TABLE IF NOT EXISTS speed_result (key TEXT PRIMARY KEY, samples TEXT, updated_at REAL)"
+        )
+        cursor.executemany(
+            "INSERT OR REPLACE INTO speed_result (key, samples, updated_at) VALUES (?, ?, ?)",
+            [
+                (key, json.dumps((cache_history.get(key, ([], 0))[0] + cache[key])[-cache_sample_size:]), updated_at)
+                for key, updated_at in cache_updated.items() if key in cache
+            ]
+        )
+        cursor.execute(
+            "CREATE TABLE IF NOT EXISTS redirect_target (url TEXT PRIMARY KEY, target TEXT, updated_at REAL)"
+        )
+        cursor.executemany(
+            "DELETE FROM redirect_target WHERE url = ?",
+            [(url,) for url, (target, _) in redirect_cache.items() if target is None]
+        )
+        cursor.executemany(
+            "INSERT OR REPLACE INTO redirect_target (url, target, updated_at) VALUES (?, ?, ?)",
+            [(url, target, updated_at) for url, (target, updated_at) in redirect_cache.items() if target]
+        )
+        conn.commit()
+    except Exception as e:
+        print(f"❌ Error saving speed test data: {e}")
+    finally:
+        return_db_connection(constants.speed_test_data_path, conn)
+
+
+async def get_test_result(data, headers=None, ipv6_proxy=None, filter_resolution=open_filter_resolution,
+                          timeout=speed_test_timeout, session: ClientSession = None) -> TestResult:
+    """
+    Get the test result of the channel data without cache
     """
     url = data['url']
     resolution = data['resolution']
     result: TestResult = {'speed': 0, 'delay': -1, 'resolution': resolution}
+    if data['ipv_type'] == "ipv6" and ipv6_proxy:
+        result.update(default_ipv6_result)
+    elif not check_url_reachable(url):
+        pass
+    elif constants.rt_url_pattern.match(url) is not None:
+        rt_result = await get_rt_result(url, headers, timeout)
+        if rt_result['delay'] != -1:
+            result['delay'] = rt_result['delay']
+            result['speed'] = float("inf")
+            result['resolution'] = result['resolution'] or rt_result['resolution']
+            if not result['resolution'] and filter_resolution:
+                result['resolution'] = await get_resolution_ffprobe(url, headers, timeout)
+    else:
+        result.update(await get_result(url, headers, resolution, filter_resolution, timeout, session))
+    return result
+
+
+async def get_speed(data, headers=None, ipv6_proxy=None, filter_resolution=open_filter_resolution,
+                    timeout=speed_test_timeout, callback=None, session: ClientSession = None,
+                    name: str = None) -> TestResult:
+    """
+    Get the speed (response time and resolution) of the url, the name of the channel is only used for the log,
+    concurrent calls with the same cache key share the result of the first test
+    """
+    resolution = data['resolution']
+    result: TestResult = {'speed': 0, 'delay': -1, 'resolution': resolution}
     try:
-        cache_key = data['host'] if speed_test_filter_host else url
+        cache_key = get_cache_key(data)
         if cache_key and cache_key in cache:
             result = get_avg_result(cache[cache_key])
+        elif cache_key and cache_key in in_flight:
+            result = {**(await asyncio.shield(in_flight[cache_key]))}
         else:
-            if data['ipv_type'] == "ipv6" and ipv6_proxy:
-                result.update(default_ipv6_result)
-            elif constants.rt_url_pattern.match(url) is not None:
-                start_time = time()
-                if not result['resolution'] and filter_resolution:
-                    result['resolution'] = await get_resolution_ffprobe(url, headers, timeout)
-                result['delay'] = int(round((time() - start_time) * 1000))
-                if result['resolution'] is not None:
-                    result['speed'] = float("inf")
-            else:
-                result.update(await get_result(url, headers, resolution, filter_resolution, timeout))
+            future = None
             if cache_key:
-                cache.setdefault(cache_key, []).append(result)
+                future = asyncio.get_running_loop().create_future()
+                in_flight[cache_key] = future
+            try:
+                result = await get_test_result(data, headers, ipv6_proxy, filter_resolution, timeout, session)
+                if cache_key:
+                    cache.setdefault(cache_key, []).append(result)
+                    if not (data['ipv_type'] == "ipv6" and ipv6_proxy):
+                        cache_updated[cache_key] = time()
+            finally:
+                if future:
+                    del in_flight[cache_key]
+                    future.set_result({**result})
     finally:
         if callback:
             callback()
-        logger.info(
-            f"Name: {data.get('name')}, URL: {data.get('url')}, From: {data.get('origin')}, IPv_Type: {data.get("ipv_type")}, Location: {data.get('location')}, ISP: {data.get('isp')}, Date: {data["date"]}, Delay: {result.get('delay') or -1} ms, Speed: {result.get('speed') or 0:.2f} M/s, Resolution: {result.get('resolution')}"
-        )
+        logger.info("", extra={"entry": {
+            'name': name or data.get('name'), 'url': data.get('url'), 'origin': data.get('origin'),
+            'ipv_type': data.get('ipv_type'), 'location': data.get('location'), 'isp': data.get('isp'),
+            'date': data.get('date'), 'delay': result.get('delay'), 'speed': result.get('speed'),
+            'resolution': result.get('resolution'), 'sustain': result.get('sustain'), 'stalls': result.get('stalls'),
+            'timing': result.get('timing')
+        }})
         return result
 
 
+def check_result_qualified(data, result: TestResult | None) -> bool:
+    """
+    Check if the result passes the speed and resolution filters of the output
+    """
+    return bool(result) and bool(get_sort_result([{**data, **result}], supply=False, filter_speed=True))
+
+
+async def get_udpxy_status(server: str, session: ClientSession, timeout: int = speed_test_timeout) -> int | None:
+    """
+    Get the number of the active clients from the status page of the udpxy server,
+    None if the status page is not available
+    """
+    try:
+        async with session.get(f"http://{server}/status", timeout=get_client_timeout(timeout)) as response:
+            if response.status != 200:
+                return None
+            content = await response.text(errors="ignore")
+            if "udpxy" not in content.lower():
+                return None
+            return len(udpxy_client_pattern.findall(content))
+    except:
+        return None
+
+
+async def probe_udpxy_servers(items: list[tuple[int, int, dict]], ipv6_proxy=None,
+                              sample: int = config.speed_test_udpxy_sample, limit: int = config.speed_test_limit,
+                              names: list[str] = None,
+                              max_clients: int = config.speed_test_udpxy_max_clients) -> int:
+    """
+    Probe the udpxy servers of the items (index, channel index, channel data) instead of testing every channel url,
+    the status page of each server is checked and the first urls of the server in order are tested one by one,
+    as udpxy limits the number of the clients. If all the sampled urls pass, the other urls of the server get the
+    average result, if all fail, they get the failed result, otherwise they are left to the full test,
+    the servers with the max clients active are not sampled, their urls are left to the full test,
+    return the number of the urls that skip the full test
+    """
+    if speed_test_filter_host:
+        return 0
+    servers = {}
+    for _, channel_index, data in items:
+        match = constants.udpxy_url_pattern.match(data["url"])
+        if match and not check_speed_cached(data) and check_url_reachable(data["url"]) and not (
+                data["ipv_type"] == "ipv6" and ipv6_proxy):
+            servers.setdefault(match.group("server"), []).append((channel_index, data))
+    servers = {server: server_items for server, server_items in servers.items() if len(server_items) > sample + 1}
+    semaphore = asyncio.Semaphore(limit)
+    filter_resolution = config.open_filter_resolution
+
+    async def probe(server, server_items, session):
+        async with semaphore:
+            clients = await get_udpxy_status(server, session)
+            if max_clients and clients is not None and clients >= max_clients:
+                logger.info(f"udpxy server: {server}, Clients: {clients}, Skipped: max clients active")
+                return 0
+            results = []
+            for channel_index, data in server_items[:sample + 1]:
+                headers = (config.open_headers and data.get("headers")) or None
+                results.append(await get_speed(
+                    data, headers=headers, filter_resolution=filter_resolution, session=session,
+                    name=names[channel_index] if names else None
+                ))
+            passed = [result for result in results if result['delay'] != -1]
+            logger.info(f"udpxy server: {server}, Clients: {clients}, Sampled: {len(results)}, Passed: {len(passed)}")
+            if passed and len(passed) < len(results):
+                return 0
+            server_result = get_avg_result(passed or results)
+            for _, data in server_items[sample + 1:]:
+                cache[get_cache_key(data)] = [{**server_result, 'resolution': data['resolution']}]
+            return len(server_items) - len(results)
+
+    async with get_speed_test_session() as session:
+        counts = await asyncio.gather(
+            *(probe(server, server_items, session) for server, server_items in servers.items())
+        )
+    return sum(counts)
+
+
+def get_unknown_result(data) -> TestResult:
+    """
+    Get the result of the untested channel data, the history result is kept if there is one
+    """
+    cache_key = get_cache_key(data)
+    if cache_key in cache:
+        return get_avg_result(cache[cache_key])
+    if cache_key in cache_history:
+        cache[cache_key] = cache_history[cache_key][0]
+        return get_avg_result(cache[cache_key])
+    return {'speed': None, 'delay': None, 'resolution': data['resolution']}
+
+
+async def get_speed_test_bandwidth(urls: list[str], count: int = bandwidth_sample_count,
+                                   timeout: int = speed_test_timeout) -> float | None:
+    """
+    Get the download bandwidth (bytes/s) shared by the speed tests, calibrate it by testing
+    a sample of the urls of different hosts at the same time if it is not set,
+    return None if the bandwidth limit is disabled or the calibration fails
+    """
+    if not config.open_speed_test_bandwidth_limit:
+        return None
+    if config.speed_test_bandwidth:
+        return config.speed_test_bandwidth * 1024 * 1024
+    sample = list({get_url_hostname(url): url for url in urls if check_url_reachable(url)}.values())[:count]
+    if not sample:
+        return None
+    async with get_speed_test_session() as session:
+        results = await asyncio.gather(
+            *(get_result(url, session=session, timeout=timeout, filter_resolution=False) for url in sample),
+            return_exceptions=True
+        )
+    speed = sum(result['speed'] for result in results if isinstance(result, dict) and result['delay'] != -1)
+    logger.info(f"Bandwidth calibration, Urls: {len(sample)}, Speed: {speed:.2f} M/s")
+    return speed * 1024 * 1024 if speed > 0 else None
+
+
+async def iter_speed_test(items: list[tuple[int, int, dict]], ipv6_proxy=None, limit: int = None,
+                          max_limit: int = None, min_limit: int = None, is_stopped=None, deadline: float = None,
+                          bandwidth: float = None, names: list[str] = None):
+    """
+    Test the speed of the items (index, channel index, channel data) under the concurrency limiters,
+    the items are dispatched from a channel priority queue to a fixed pool of worker coroutines,
+    so the memory scales with the concurrency instead of the number of urls, the names of the channels
+    are looked up by the channel index for the log, yield the (index, result, concurrency limit)
+    as the tests complete, the result is None if the channel is stopped before the test is dispatched,
+    no more tests are dispatched if they can not finish before the deadline, the rest get the unknown result,
+    with the bandwidth (bytes/s) set the downloads share a bandwidth meter and no more tests are dispatched
+    while the bandwidth is used up, so the speed of each test is not capped by the others
+    """
+    global bandwidth_meter
+    bandwidth_meter = BandwidthMeter(bandwidth) if bandwidth else None
+    open_headers = config.open_headers
+    filter_resolution = config.open_filter_resolution
+    limiter = AdaptiveLimiter(
+        limit or config.speed_test_limit,
+        min_limit=min_limit or config.speed_test_min_limit,
+        max_limit=max_limit or config.speed_test_max_limit,
+        adaptive=config.open_speed_test_adaptive_limit
+    )
+    host_limiter = HostLimiter(config.speed_test_limit_per_host, config.speed_test_limit_per_subnet)
+    queue = ChannelQueue(
+        items,
+        channel_key=lambda item: item[1],
+        host_key=lambda item: get_url_hostname(item[2]["url"]),
+        limit_per_host=config.speed_test_limit_per_host
+    )
+
+    async def limited_get_speed(item, session):
+        data = item[2]
+        name = names[item[1]] if names else data.get("name")
+        headers = (open_headers and data.get("headers")) or None
+        if not check_url_reachable(data["url"]):
+            return await get_speed(data, headers=headers, name=name)
+        async with host_limiter.limit(get_url_hostname(data["url"])):
+            async with limiter:
+                start_time = time()
+                result = await get_speed(
+                    data,
+                    headers=headers,
+                    ipv6_proxy=ipv6_proxy,
+                    filter_resolution=filter_resolution,
+                    session=session,
+                    name=name
+                )
+                limiter.record(
+                    result.get("speed"), result.get("delay"),
+                    timed_out=time() - start_time >= timed_out_threshold
+                )
+                return result
+
+    async def worker(session):
+        while (item := await work_queue.get()) is not None:
+            try:
+                result = await limited_get_speed(item, session)
+            except Exception as e:
+                result = e
+            result_queue.put_nowait((item, result))
+
+    work_queue = asyncio.Queue()
+    result_queue = asyncio.Queue()
+    worker_count = limiter.max_limit if limiter.adaptive else limiter.current_limit
+    async with get_speed_test_session(worker_count) as session:
+        workers = [asyncio.create_task(worker(session)) for _ in range(worker_count)]
+        active = 0
+        try:
+            while True:
+                while active < limiter.current_limit and not (
+                        deadline and time() + speed_test_timeout > deadline) and not (
+                        active and bandwidth_meter and bandwidth_meter.usage >= bandwidth_usage_limit):
+                    item = queue.get()
+                    if item is None:
+                        break
+                    if is_stopped and is_stopped(item[1]):
+                        queue.done(item)
+                        yield item[0], None, limiter.current_limit
+                        continue
+                    work_queue.put_nowait(item)
+                    active += 1
+                if not active:
+                    break
+                try:
+                    item, result = await asyncio.wait_for(
+                        result_queue.get(), timeout=sample_check_interval if bandwidth_meter else None
+                    )
+                except asyncio.TimeoutError:
+                    continue
+                active -= 1
+                if isinstance(result, Exception):
+                    raise result
+                queue.done(item, check_result_qualified(item[2], result))
+                yield item[0], result, limiter.current_limit
+            if len(queue):
+                logger.info(f"Speed test deadline reached, untested urls: {len(queue)}")
+            for index, channel_index, data in queue.drain():
+                yield index, None if is_stopped and is_stopped(channel_index) else get_unknown_result(
+                    data), limiter.current_limit
+        finally:
+            bandwidth_meter = None
+            for task in workers:
+                task.cancel()
+
+
+def start_speed_test_log():
+    """
+    Start the background writer of the speed test log, in the JSON lines format if structured
+    """
+    global log_listener
+    _, log_listener = get_queue_logger(
+        constants.speed_test_log_path,
+        level=INFO,
+        init=True,
+        max_bytes=int(config.speed_test_log_max_size * 1024 * 1024),
+        formatter=EntryFormatter(format_speed_test_log, structured=config.open_speed_test_log_json)
+    )
+
+
+def stop_speed_test_log():
+    """
+    Stop the background writer of the speed test log after the rest of the records are written
+    """
+    global log_listener
+    logger.handlers.clear()
+    if log_listener:
+        log_listener.stop()
+        for handler in log_listener.handlers:
+            handler.close()
+        log_listener = None
+
+
+def speed_test_worker(worker_index: int, items: list[tuple[int, int, dict]], ipv6_proxy, limit: int,
+                      max_limit: int, min_limit: int, connect_data: dict, redirect_data: dict, cache_data: TestResultCacheData,
+                      history_data: dict, stop_flags, queue: multiprocessing.Queue, deadline: float = None,
+                      bandwidth: float = None, names: list[str] = None, log_queue: multiprocessing.Queue = None):
+    """
+    Speed test worker process with its own event loop and session,
+    put the (worker index, index, result, concurrency limit, tested) to the queue as the tests complete,
+    and the redirect targets once finished, the cache and the history are the snapshots of the shard taken
+    by the main process (with the results of the udpxy server probe), the speed test store is only accessed
+    by the main process, the log records are put to the log queue and written by the main process
+    """
+    if log_queue is not None:
+        logger.addHandler(QueueHandler(log_queue))
+        logger.setLevel(INFO)
+    connect_cache.update(connect_data)
+    redirect_cache.update(redirect_data)
+    cache.update(cache_data)
+    cache_history.update(history_data)
+    data_map = {index: data for index, _, data in items}
+
+    async def run():
+        async for index, result, current_limit in iter_speed_test(
+                items, ipv6_proxy, limit, max_limit, min_limit, is_stopped=lambda channel_index: stop_flags[channel_index],
+                deadline=deadline, bandwidth=bandwidth, names=names
+        ):
+            tested = get_cache_key(data_map[index]) in cache_updated
+            queue.put((worker_index, index, result, current_limit, tested))
+
+    install_uvloop()
+    try:
+        asyncio.run(run())
+    finally:
+        logger.handlers.clear()
+        queue.put(redirect_cache)
+
+
+async def iter_speed_test_processes(shards: list[list[tuple[int, int, dict]]], ipv6_proxy=None, stop_flags=None,
+                                    deadline: float = None, bandwidth: float = None, names: list[str] = None):
+    """
+    Test the speed of the shards in the worker processes, yield the (index, result, concurrency limit)
+    as the tests complete, the results and the redirect targets of the workers are merged into the cache
+    of this process, the bandwidth is divided equally between the workers
+    """
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    log_queue = context.Queue() if log_listener else None
+    worker_log_listener = QueueListener(log_queue, *log_listener.handlers) if log_listener else None
+    count = len(shards)
+    limit = math.ceil(config.speed_test_limit / count)
+    max_limit = math.ceil(config.speed_test_max_limit / count)
+    min_limit = math.ceil(config.speed_test_min_limit / count)
+    data_map = {index: data for shard in shards for index, _, data in shard}
+    limits = {}
+    shard_keys = [[get_cache_key(data) for _, _, data in shard] for shard in shards]
+    processes = [
+        context.Process(
+            target=speed_test_worker,
+            args=(i, shard, ipv6_proxy, limit, max_limit, min_limit, connect_cache, redirect_cache,
+                  {key: cache[key] for key in shard_keys[i] if key in cache},
+                  {key: cache_history[key] for key in shard_keys[i] if key in cache_history},
+                  stop_flags, queue, deadline, bandwidth / count if bandwidth else None, names, log_queue),
+            daemon=True
+        )
+        for i, shard in enumerate(shards)
+    ]
+    loop = asyncio.get_running_loop()
+    finished = 0
+    try:
+        if worker_log_listener:
+            worker_log_listener.start()
+        for process in processes:
+            process.start()
+        while finished < count:
+            try:
+                message = await loop.run_in_executor(None, queue.get, True, 1)
+            except Empty:
+                if not any(process.is_alive() for process in processes) and queue.empty():
+                    break
+                continue
+            if isinstance(message, dict):
+                for url, target in message.items():
+                    if url not in redirect_cache or target[1] >= redirect_cache[url][1]:
+                        redirect_cache[url] = target
+                finished += 1
+                continue
+            worker_index, index, result, current_limit, tested = message
+            limits[worker_index] = current_limit
+            if result is not None:
+                cache_key = get_cache_key(data_map[index])
+                if cache_key not in cache:
+                    cache[cache_key] = [result]
+                    if tested:
+                        cache_updated[cache_key] = time()
+            yield index, result, sum(limits.values())
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.join(1)
+            if process.is_alive():
+                process.terminate()
+        if worker_log_listener:
+            worker_log_listener.stop()
+
+
 def get_sort_result(
         results,
         supply=open_supply,
@@ -382,10 +1424,12 @@ def get_sort_result(
         filter_resolution=open_filter_resolution,
         min_resolution=min_resolution_value,
         max_resolution=max_resolution_value,
-        ipv6_support=True
+        ipv6_support=True,
+        playback=open_speed_test_playback
 ) -> list[ChannelTestResult]:
     """
-    get the sort result
+    get the sort result, with the playback the results are ranked by the stalls and the sustain ratio
+    before the speed, the results without the playback simulation are taken as sustained
     """
     total_result = []
     for result in results:
@@ -406,5 +1450,15 @@ def get_sort_result(
                 if resolution_value < min_resolution or resolution_value > max_resolution:
                     continue
         total_result.append(result)
-    total_result.sort(key=lambda item: item.get("speed") or 0, reverse=True)
+    if playback:
+        total_result.sort(
+            key=lambda item: (
+                -(item.get("stalls") or 0),
+                min(1 if item.get("sustain") is None else item["sustain"], 1),
+                item.get("speed") or 0
+            ),
+            reverse=True
+        )
+    else:
+        total_result.sort(key=lambda item: item.get("speed") or 0, reverse=True)
     return total_result
@@ -0,0 +1,330 @@
+import asyncio
+import base64
+import os
+import struct
+from time import time
+from urllib.parse import urlparse, unquote
+
+from utils.video import get_resolution_from_flv_video_tag, get_resolution_from_sdp
+
+rtsp_default_port = 554
+rtsp_user_agent = "LibVLC/3.0.20 (LIVE555 Streaming Media v2016.11.28)"
+rtmp_default_port = 1935
+rtmp_version = 3
+rtmp_handshake_size = 1536
+rtmp_default_chunk_size = 128
+rtmp_max_message_size = 4 * 1024 * 1024
+rtmp_message_limit = 256
+rtmp_set_chunk_size = 1
+rtmp_user_control = 4
+rtmp_video = 9
+rtmp_data_amf0 = 18
+rtmp_command_amf0 = 20
+rtmp_ping_request = 6
+rtmp_ping_response = 7
+rtmp_set_buffer_length = 3
+rtmp_error_levels = {"error"}
+probe_errors = (OSError, ValueError, EOFError, IndexError, UnicodeError, struct.error, asyncio.IncompleteReadError,
+                asyncio.LimitOverrunError, TimeoutError)
+
+
+def encode_amf0(value) -> bytes:
+    """
+    Encode the value to AMF0, supports None, bool, number, string and object
+    """
+    if value is None:
+        return b"\x05"
+    if isinstance(value, bool):
+        return b"\x01" + bytes([value])
+    if isinstance(value, (int, float)):
+        return b"\x00" + struct.pack(">d", value)
+    if isinstance(value, str):
+        data = value.encode()
+        return b"\x02" + struct.pack(">H", len(data)) + data
+    if isinstance(value, dict):
+        return b"\x03" + b"".join(
+            struct.pack(">H", len(key.encode())) + key.encode() + encode_amf0(item) for key, item in value.items()
+        ) + b"\x00\x00\x09"
+    raise TypeError(f"Unsupported AMF0 value: {value!r}")
+
+
+def decode_amf0(data: bytes, offset: int = 0) -> tuple[any, int]:
+    """
+    Decode the AMF0 value at the offset, return the value and the offset after it
+    """
+    marker = data[offset]
+    offset += 1
+    if marker == 0x00:
+        return struct.unpack_from(">d", data, offset)[0], offset + 8
+    if marker == 0x01:
+        return bool(data[offset]), offset + 1
+    if marker in (0x02, 0x0C):
+        size_length = 2 if marker == 0x02 else 4
+        length = int.from_bytes(data[offset:offset + size_length], "big")
+        offset += size_length
+        return data[offset:offset + length].decode("utf-8", "ignore"), offset + length
+    if marker in (0x03, 0x08):
+        if marker == 0x08:
+            offset += 4
+        obj = {}
+        while offset + 3 <= len(data):
+            length = int.from_bytes(data[offset:offset + 2], "big")
+            if length == 0 and data[offset + 2] == 0x09:
+                return obj, offset + 3
+            key = data[offset + 2:offset + 2 + length].decode("utf-8", "ignore")
+            obj[key], offset = decode_amf0(data, offset + 2 + length)
+        raise ValueError("Invalid AMF0 object")
+    if marker in (0x05, 0x06):
+        return None, offset
+    if marker == 0x0A:
+        count = int.from_bytes(data[offset:offset + 4], "big")
+        offset += 4
+        items = []
+        for _ in range(count):
+            item, offset = decode_amf0(data, offset)
+            items.append(item)
+        return items, offset
+    if marker == 0x0B:
+        return struct.unpack_from(">d", data, offset)[0], offset + 10
+    raise ValueError(f"Unsupported AMF0 marker: {marker}")
+
+
+def decode_amf0_values(data: bytes) -> list:
+    """
+    Decode all the AMF0 values of the message payload
+    """
+    values = []
+    offset = 0
+    while offset < len(data):
+        value, offset = decode_amf0(data, offset)
+        values.append(value)
+    return values
+
+
+class RTMPConnection:
+    """
+    Minimal RTMP client connection, reads and writes the messages over the chunk stream
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.in_chunk_size = rtmp_default_chunk_size
+        self.headers = {}
+        self.buffers = {}
+
+    async def handshake(self):
+        c1 = struct.pack(">II", 0, 0) + os.urandom(rtmp_handshake_size - 8)
+        self.writer.write(bytes([rtmp_version]) + c1)
+        await self.writer.drain()
+        s0s1 = await self.reader.readexactly(1 + rtmp_handshake_size)
+        if s0s1[0] != rtmp_version:
+            raise ValueError("Unsupported RTMP version")
+        self.writer.write(s0s1[1:])
+        await self.reader.readexactly(rtmp_handshake_size)
+
+    def send(self, csid: int, message_type: int, payload: bytes, stream_id: int = 0):
+        header = bytes([csid]) + bytes(3) + len(payload).to_bytes(3, "big") + bytes([message_type]) + struct.pack(
+            "<I", stream_id)
+        chunks = [payload[i:i + rtmp_default_chunk_size] for i in range(0, len(payload), rtmp_default_chunk_size)]
+        self.writer.write(header + b"".join(
+            (bytes([0xC0 | csid]) if i else b"") + chunk for i, chunk in enumerate(chunks or [b""])
+        ))
+
+    def send_command(self, name: str, transaction: int, *args, stream_id: int = 0, csid: int = 3):
+        payload = encode_amf0(name) + encode_amf0(transaction) + b"".join(encode_amf0(arg) for arg in args)
+        self.send(csid, rtmp_command_amf0, payload, stream_id)
+
+    async def read_message(self) -> tuple[int, int, bytes]:
+        """
+        Read the next complete message, the protocol control messages are handled,
+        return the (message type, message stream id, payload)
+        """
+        while True:
+            first = (await self.reader.readexactly(1))[0]
+            fmt, csid = first >> 6, first & 0x3F
+            if csid == 0:
+                csid = 64 + (await self.reader.readexactly(1))[0]
+            elif csid == 1:
+                data = await self.reader.readexactly(2)
+                csid = 64 + data[0] + data[1] * 256
+            header = self.headers.get(csid)
+            if header is None and fmt != 0:
+                raise ValueError("Invalid chunk stream")
+            if fmt < 3:
+                data = await self.reader.readexactly((11, 7, 3)[fmt])
+                extended = data[:3] == b"\xff\xff\xff"
+                if fmt == 0:
+                    header = {"length": int.from_bytes(data[3:6], "big"), "type": data[6],
+                              "stream_id": struct.unpack("<I", data[7:11])[0]}
+                elif fmt == 1:
+                    header.update({"length": int.from_bytes(data[3:6], "big"), "type": data[6]})
+                header["extended"] = extended
+                self.headers[csid] = header
+            if header["extended"]:
+                await self.reader.readexactly(4)
+            if header["length"] > rtmp_max_message_size:
+                raise ValueError("Message too large")
+            buffer = self.buffers.setdefault(csid, bytearray())
+            buffer += await self.reader.readexactly(min(self.in_chunk_size, header["length"] - len(buffer)))
+            if len(buffer) < header["length"]:
+                continue
+            payload = bytes(buffer)
+            self.buffers[csid] = bytearray()
+            if header["type"] == rtmp_set_chunk_size:
+                self.in_chunk_size = struct.unpack(">I", payload[:4])[0] & 0x7FFFFFFF
+            elif header["type"] == rtmp_user_control and struct.unpack(">H", payload[:2])[0] == rtmp_ping_request:
+                self.send(2, rtmp_user_control, struct.pack(">H", rtmp_ping_response) + payload[2:6])
+            else:
+                return header["type"], header["stream_id"], payload
+
+
+def get_rtmp_app_stream(url: str) -> tuple[str, str, str]:
+    """
+    Get the (tcUrl, app, stream name) of the RTMP url, the last path segment with the query is the stream name
+    """
+    parsed = urlparse(url)
+    app, _, stream = parsed.path.strip("/").rpartition("/")
+    if not app:
+        raise ValueError("Invalid RTMP url")
+    if parsed.query:
+        stream = f"{stream}?{parsed.query}"
+    return f"rtmp://{parsed.netloc}/{app}", app, stream
+
+
+async def get_rtmp_result(url: str, timeout: int | float = 10) -> dict[str, int | str | None]:
+    """
+    Get the delay and resolution of the RTMP url by the handshake, connect, createStream and play commands,
+    the delay is the time until the play starts and the resolution is parsed from the first video tag
+    (the sequence header) or the onMetaData
+    """
+    result = {'delay': -1, 'resolution': None}
+    metadata_resolution = None
+    start_time = time()
+    writer = None
+    try:
+        tc_url, app, stream = get_rtmp_app_stream(url)
+        parsed = urlparse(url)
+        async with asyncio.timeout(timeout):
+            reader, writer = await asyncio.open_connection(parsed.hostname, parsed.port or rtmp_default_port)
+            conn = RTMPConnection(reader, writer)
+            await conn.handshake()
+            conn.send_command("connect", 1, {
+                "app": app, "flashVer": "LNX 9,0,124,2", "tcUrl": tc_url, "fpad": False, "capabilities": 15,
+                "audioCodecs": 3191, "videoCodecs": 252, "videoFunction": 1
+            })
+            await writer.drain()
+            for _ in range(rtmp_message_limit):
+                message_type, _, payload = await conn.read_message()
+                if message_type == rtmp_command_amf0:
+                    values = decode_amf0_values(payload)
+                    name, transaction = values[0], values[1] if len(values) > 1 else None
+                    info = values[3] if len(values) > 3 and isinstance(values[3], dict) else {}
+                    if name == "_error" or info.get("level") in rtmp_error_levels:
+                        raise ValueError(f"RTMP error: {info.get('code')}")
+                    if name == "_result" and transaction == 1:
+                        conn.send_command("createStream", 2, None)
+                    elif name == "_result" and transaction == 2:
+                        stream_id = int(values[3])
+                        conn.send(2, rtmp_user_control, struct.pack(">HII", rtmp_set_buffer_length, stream_id, 1000))
+                        conn.send_command("play", 0, None, stream, -2, stream_id=stream_id, csid=8)
+                    elif name == "onStatus" and info.get("code") == "NetStream.Play.Start" and result['delay'] == -1:
+                        result['delay'] = int(round((time() - start_time) * 1000))
+                    await writer.drain()
+                elif message_type == rtmp_data_amf0:
+                    for value in decode_amf0_values(payload):
+                        if isinstance(value, dict) and value.get("width") and value.get("height"):
+                            metadata_resolution = f"{int(value['width'])}x{int(value['height'])}"
+                elif message_type == rtmp_video and payload:
+                    if result['delay'] == -1:
+                        result['delay'] = int(round((time() - start_time) * 1000))
+                    resolution = get_resolution_from_flv_video_tag(payload)
+                    if resolution:
+                        result['resolution'] = f"{resolution[0]}x{resolution[1]}"
+                    break
+    except probe_errors:
+        pass
+    finally:
+        if writer:
+            writer.close()
+    if result['delay'] != -1 and not result['resolution']:
+        result['resolution'] = metadata_resolution
+    return result
+
+
+async def read_rtsp_response(reader: asyncio.StreamReader) -> tuple[int, dict[str, str], str]:
+    """
+    Read the RTSP response, return the (status code, lowercase headers, body)
+    """
+    lines = (await reader.readuntil(b"\r\n\r\n")).decode("utf-8", "ignore").split("\r\n")
+    version, status = lines[0].split()[:2]
+    if not version.startswith("RTSP/"):
+        raise ValueError("Invalid RTSP response")
+    headers = {key.strip().lower(): value.strip() for key, _, value in (line.partition(":") for line in lines[1:])
+               if key}
+    body = await reader.readexactly(int(headers.get("content-length") or 0))
+    return int(status), headers, body.decode("utf-8", "ignore")
+
+
+def get_rtsp_request_url(url: str) -> tuple[str, str]:
+    """
+    Get the (request url, Authorization header line) of the RTSP url, the default port is added if it is absent,
+    and the credentials of the userinfo are moved to the Basic Authorization header
+    """
+    parsed = urlparse(url)
+    userinfo, _, netloc = parsed.netloc.rpartition("@")
+    if parsed.port is None:
+        netloc = f"{netloc}:{rtsp_default_port}"
+    authorization = ""
+    if userinfo:
+        credentials = base64.b64encode(
+            f"{unquote(parsed.username or '')}:{unquote(parsed.password or '')}".encode()
+        ).decode()
+        authorization = f"Authorization: Basic {credentials}\r\n"
+    return parsed._replace(netloc=netloc).geturl(), authorization
+
+
+async def get_rtsp_result(url: str, headers: dict = None, timeout: int | float = 10) -> dict[str, int | str | None]:
+    """
+    Get the delay and resolution of the RTSP url by the OPTIONS and DESCRIBE requests,
+    the delay is the time until the SDP is received and the resolution is parsed from the SDP
+    """
+    result = {'delay': -1, 'resolution': None}
+    start_time = time()
+    writer = None
+    try:
+        parsed = urlparse(url)
+        port = parsed.port or rtsp_default_port
+        request_url, authorization = get_rtsp_request_url(url)
+        user_agent = (headers or {}).get("User-Agent", rtsp_user_agent)
+        async with asyncio.timeout(timeout):
+            reader, writer = await asyncio.open_connection(parsed.hostname, port)
+            for cseq, method, extra in ((1, "OPTIONS", ""), (2, "DESCRIBE", "Accept: application/sdp\r\n")):
+                writer.write(
+                    f"{method} {request_url} RTSP/1.0\r\nCSeq: {cseq}\r\n"
+                    f"User-Agent: {user_agent}\r\n{authorization}{extra}\r\n".encode()
+                )
+                await writer.drain()
+                status, _, body = await read_rtsp_response(reader)
+            if status == 200:
+                result['delay'] = int(round((time() - start_time) * 1000))
+                resolution = get_resolution_from_sdp(body)
+                if resolution:
+                    result['resolution'] = f"{resolution[0]}x{resolution[1]}"
+            elif status == 401 and parsed.username:
+                result['delay'] = int(round((time() - start_time) * 1000))
+    except probe_errors:
+        pass
+    finally:
+        if writer:
+            writer.close()
+    return result
+
+
+async def get_rt_result(url: str, headers: dict = None, timeout: int | float = 10) -> dict[str, int | str | None]:
+    """
+    Get the delay and resolution of the RTSP or RTMP url with the native protocol probe
+    """
+    if url.startswith("rtsp://"):
+        return await get_rtsp_result(url, headers, timeout)
+    return await get_rtmp_result(url, timeout)
@@ -1,12 +1,15 @@
+import asyncio
 import datetime
 import json
 import logging
+import math
 import os
+import queue
 import re
 import shutil
 import sys
 from collections import defaultdict
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from time import time
 from urllib.parse import urlparse, urlunparse
 
@@ -21,6 +24,8 @@ from utils.config import config, resource_path
 from utils.types import ChannelData
 
 opencc_t2s = OpenCC("t2s")
+log_batch_size = 100
+log_flush_interval = 1
 
 
 def get_logger(path, level=logging.ERROR, init=False):
@@ -38,6 +43,125 @@ def get_logger(path, level=logging.ERROR, init=False):
     return logger
 
 
+class BatchRotatingFileHandler(RotatingFileHandler):
+    """
+    Rotating file handler that flushes the stream once per batch of records instead of once per record
+    """
+
+    def __init__(self, filename, max_bytes: int = 0, backup_count: int = 0, batch_size: int = log_batch_size,
+                 flush_interval: float = log_flush_interval):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.pending = 0
+        self.flushed_at = time()
+
+    def flush(self):
+        self.pending += 1
+        if self.pending >= self.batch_size or time() - self.flushed_at >= self.flush_interval:
+            self.flush_batch()
+
+    def flush_batch(self):
+        self.pending = 0
+        self.flushed_at = time()
+        super().flush()
+
+    def close(self):
+        self.acquire()
+        try:
+            self.flush_batch()
+        finally:
+            self.release()
+        super().close()
+
+
+class LazyQueueHandler(QueueHandler):
+    """
+    Queue handler that leaves the formatting of the record to the listener thread
+    """
+
+    def prepare(self, record):
+        return record
+
+
+class EntryFormatter(logging.Formatter):
+    """
+    Format the log record with the entry of its extra data, as a compact JSON line if structured,
+    otherwise as the readable line of the format function, the records without entry use the message
+    """
+
+    def __init__(self, format_entry=None, structured: bool = False):
+        super().__init__()
+        self.format_entry = format_entry
+        self.structured = structured
+
+    @staticmethod
+    def get_json_value(value):
+        """
+        Get the value for the strict JSON, the non-finite floats (such as the infinite speed of IPv6) are null
+        """
+        if isinstance(value, float):
+            return value if math.isfinite(value) else None
+        if isinstance(value, dict):
+            return {key: EntryFormatter.get_json_value(item) for key, item in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [EntryFormatter.get_json_value(item) for item in value]
+        return value
+
+    def format(self, record):
+        entry = getattr(record, "entry", None)
+        if self.structured:
+            return json.dumps(
+                self.get_json_value({"time": round(record.created, 3), **(entry or {"message": record.getMessage()})}),
+                ensure_ascii=False, separators=(",", ":"), default=str, allow_nan=False
+            )
+        if entry is not None and self.format_entry:
+            return self.format_entry(entry)
+        return record.getMessage()
+
+
+def get_queue_logger(path, level=logging.INFO, init=False, max_bytes: int = 0, backup_count: int = 1,
+                     formatter: logging.Formatter = None) -> tuple[logging.Logger, QueueListener]:
+    """
+    Get the logger writing in the background, the records are put to a queue and written by the listener thread
+    in batches, the file rotates by the max bytes or is recreated on init if the max bytes is not set,
+    stop the listener to write the rest of the records
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if init and not max_bytes and os.path.exists(path):
+        os.remove(path)
+    handler = BatchRotatingFileHandler(path, max_bytes, backup_count if max_bytes else 0)
+    if formatter:
+        handler.setFormatter(formatter)
+    log_queue = queue.SimpleQueue()
+    logger = logging.getLogger(path)
+    logger.handlers.clear()
+    logger.addHandler(LazyQueueHandler(log_queue))
+    logger.setLevel(level)
+    listener = QueueListener(log_queue, handler)
+    listener.start()
+    return logger, listener
+
+
+def format_speed_test_log(entry: dict) -> str:
+    """
+    Format the speed test log entry to the readable line
+    """
+    line = (
+        f"Name: {entry.get('name')}, URL: {entry.get('url')}, From: {entry.get('origin')}, "
+        f"IPv_Type: {entry.get('ipv_type')}, Location: {entry.get('location')}, ISP: {entry.get('isp')}, "
+        f"Date: {entry.get('date')}, Delay: {entry.get('delay') or -1} ms, Speed: {entry.get('speed') or 0:.2f} M/s, "
+        f"Resolution: {entry.get('resolution')}"
+    )
+    if entry.get('sustain') is not None:
+        line += f", Sustain: {entry['sustain']}, Stalls: {entry['stalls']}"
+    timing = entry.get('timing')
+    if timing:
+        line += (f", DNS: {timing['dns']} ms, Connect: {timing['connect']} ms, TTFB: {timing['ttfb']} ms, "
+                 f"Transfer: {timing['transfer']} ms")
+    return line
+
+
 def format_interval(t):
     """
     Formats a number of seconds as a clock time, [H:]MM:SS
@@ -754,3 +878,31 @@ def get_urls_len(data) -> int:
         for url_info in url_info_list
     )
     return len(urls)
+
+
+def get_partitioned_list(items: list, key, count: int) -> list[list]:
+    """
+    Partition the items into at most count lists, items with the same key are kept in the same list,
+    the largest groups are assigned first to the list with the fewest items
+    """
+    groups = defaultdict(list)
+    for item in items:
+        groups[key(item)].append(item)
+    partitions = [[] for _ in range(max(count, 1))]
+    for group in sorted(groups.values(), key=len, reverse=True):
+        min(partitions, key=len).extend(group)
+    return [partition for partition in partitions if partition]
+
+
+def install_uvloop() -> bool:
+    """
+    Use the uvloop event loop if it is enabled and installed
+    """
+    if not config.open_uvloop:
+        return False
+    try:
+        import uvloop
+    except ImportError:
+        return False
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return True
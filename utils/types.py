@@ -27,11 +27,15 @@ CategoryChannelData = dict[str, dict[str, list[ChannelData]]]
 
 class TestResult(TypedDict):
     """
-    Test result types, including speed, delay, resolution
+    Test result types, including speed, delay, resolution, the sustain ratio and stalls of the playback,
+    and the timing (dns, connect, ttfb, transfer in ms) of the request
     """
     speed: int | float | None
     delay: int | float | None
     resolution: int | str | None
+    sustain: NotRequired[float | None]
+    stalls: NotRequired[int | None]
+    timing: NotRequired[dict[str, int] | None]
 
 
 TestResultCacheData = dict[str, list[TestResult]]
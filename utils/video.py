@@ -0,0 +1,451 @@
+import base64
+import binascii
+
+ts_packet_size = 188
+ts_sync_byte = 0x47
+h264_stream_types = {0x1B}
+h265_stream_types = {0x24}
+mpeg2_stream_types = {0x01, 0x02}
+h264_high_profiles = {100, 110, 122, 244, 44, 83, 86, 118, 128, 138, 139, 134, 135}
+h264_sps_type = 7
+h265_sps_type = 33
+flv_video_tag_type = 9
+flv_avc_codec_id = 7
+flv_hevc_codec_id = 12
+mpeg2_sequence_header = b"\x00\x00\x01\xb3"
+
+
+class BitReader:
+    """
+    Big-endian bit reader with Exp-Golomb support
+    """
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.pos = 0
+
+    def read_bits(self, n: int) -> int:
+        value = 0
+        for _ in range(n):
+            byte_index = self.pos >> 3
+            if byte_index >= len(self.data):
+                raise EOFError("Not enough bits")
+            value = (value << 1) | ((self.data[byte_index] >> (7 - (self.pos & 7))) & 1)
+            self.pos += 1
+        return value
+
+    def skip_bits(self, n: int):
+        if (self.pos + n) > len(self.data) * 8:
+            raise EOFError("Not enough bits")
+        self.pos += n
+
+    def read_ue(self) -> int:
+        zeros = 0
+        while self.read_bits(1) == 0:
+            zeros += 1
+            if zeros > 31:
+                raise ValueError("Invalid Exp-Golomb code")
+        return (1 << zeros) - 1 + self.read_bits(zeros)
+
+    def read_se(self) -> int:
+        value = self.read_ue()
+        return (value + 1) // 2 if value & 1 else -(value // 2)
+
+
+def remove_emulation_prevention(data: bytes) -> bytes:
+    """
+    Remove the emulation prevention bytes (0x000003) from the NAL unit
+    """
+    return data.replace(b"\x00\x00\x03", b"\x00\x00")
+
+
+def skip_h264_scaling_list(reader: BitReader, size: int):
+    last_scale = 8
+    next_scale = 8
+    for _ in range(size):
+        if next_scale != 0:
+            delta_scale = reader.read_se()
+            next_scale = (last_scale + delta_scale + 256) % 256
+        last_scale = last_scale if next_scale == 0 else next_scale
+
+
+def parse_h264_sps(nal: bytes) -> tuple[int, int] | None:
+    """
+    Parse the width and height from the H.264 SPS NAL unit (including the NAL header)
+    """
+    try:
+        reader = BitReader(remove_emulation_prevention(nal[1:]))
+        profile_idc = reader.read_bits(8)
+        reader.skip_bits(16)
+        reader.read_ue()
+        chroma_format_idc = 1
+        separate_colour_plane = 0
+        if profile_idc in h264_high_profiles:
+            chroma_format_idc = reader.read_ue()
+            if chroma_format_idc == 3:
+                separate_colour_plane = reader.read_bits(1)
+            reader.read_ue()
+            reader.read_ue()
+            reader.skip_bits(1)
+            if reader.read_bits(1):
+                for i in range(8 if chroma_format_idc != 3 else 12):
+                    if reader.read_bits(1):
+                        skip_h264_scaling_list(reader, 16 if i < 6 else 64)
+        reader.read_ue()
+        pic_order_cnt_type = reader.read_ue()
+        if pic_order_cnt_type == 0:
+            reader.read_ue()
+        elif pic_order_cnt_type == 1:
+            reader.skip_bits(1)
+            reader.read_se()
+            reader.read_se()
+            for _ in range(reader.read_ue()):
+                reader.read_se()
+        reader.read_ue()
+        reader.skip_bits(1)
+        width_in_mbs = reader.read_ue() + 1
+        height_in_map_units = reader.read_ue() + 1
+        frame_mbs_only = reader.read_bits(1)
+        if not frame_mbs_only:
+            reader.skip_bits(1)
+        reader.skip_bits(1)
+        width = width_in_mbs * 16
+        height = (2 - frame_mbs_only) * height_in_map_units * 16
+        if reader.read_bits(1):
+            crop_left, crop_right, crop_top, crop_bottom = (reader.read_ue() for _ in range(4))
+            if separate_colour_plane or chroma_format_idc == 0:
+                crop_unit_x, crop_unit_y = 1, 2 - frame_mbs_only
+            else:
+                sub_width = 1 if chroma_format_idc == 3 else 2
+                sub_height = 2 if chroma_format_idc == 1 else 1
+                crop_unit_x, crop_unit_y = sub_width, sub_height * (2 - frame_mbs_only)
+            width -= crop_unit_x * (crop_left + crop_right)
+            height -= crop_unit_y * (crop_top + crop_bottom)
+        return (width, height) if width > 0 and height > 0 else None
+    except (EOFError, ValueError):
+        return None
+
+
+def parse_h265_sps(nal: bytes) -> tuple[int, int] | None:
+    """
+    Parse the width and height from the H.265 SPS NAL unit (including the NAL header)
+    """
+    try:
+        reader = BitReader(remove_emulation_prevention(nal[2:]))
+        reader.skip_bits(4)
+        max_sub_layers_minus1 = reader.read_bits(3)
+        reader.skip_bits(1)
+        reader.skip_bits(96)
+        sub_layer_flags = [(reader.read_bits(1), reader.read_bits(1)) for _ in range(max_sub_layers_minus1)]
+        if max_sub_layers_minus1 > 0:
+            reader.skip_bits(2 * (8 - max_sub_layers_minus1))
+        for profile_present, level_present in sub_layer_flags:
+            if profile_present:
+                reader.skip_bits(88)
+            if level_present:
+                reader.skip_bits(8)
+        reader.read_ue()
+        chroma_format_idc = reader.read_ue()
+        if chroma_format_idc == 3:
+            reader.skip_bits(1)
+        width = reader.read_ue()
+        height = reader.read_ue()
+        if reader.read_bits(1):
+            conf_left, conf_right, conf_top, conf_bottom = (reader.read_ue() for _ in range(4))
+            sub_width = 2 if chroma_format_idc in (1, 2) else 1
+            sub_height = 2 if chroma_format_idc == 1 else 1
+            width -= sub_width * (conf_left + conf_right)
+            height -= sub_height * (conf_top + conf_bottom)
+        return (width, height) if width > 0 and height > 0 else None
+    except (EOFError, ValueError):
+        return None
+
+
+def parse_mpeg2_sequence_header(data: bytes) -> tuple[int, int] | None:
+    """
+    Parse the width and height from the MPEG-2 video sequence header
+    """
+    index = data.find(mpeg2_sequence_header)
+    if index == -1 or index + 7 > len(data):
+        return None
+    header = data[index + 4:index + 7]
+    width = (header[0] << 4) | (header[1] >> 4)
+    height = ((header[1] & 0x0F) << 8) | header[2]
+    return (width, height) if width > 0 and height > 0 else None
+
+
+def iter_annexb_nals(data: bytes):
+    """
+    Iterate the NAL units of the Annex B byte stream
+    """
+    start = data.find(b"\x00\x00\x01")
+    while start != -1:
+        start += 3
+        end = data.find(b"\x00\x00\x01", start)
+        nal = data[start:end if end != -1 else len(data)]
+        yield nal.rstrip(b"\x00") if end != -1 else nal
+        start = end
+
+
+def get_resolution_from_annexb(data: bytes, codec: str = None) -> tuple[int, int] | None:
+    """
+    Get the resolution from the SPS of the Annex B byte stream, the codec is detected if not specified
+    """
+    for nal in iter_annexb_nals(data):
+        if not nal:
+            continue
+        if codec in (None, "h264") and nal[0] & 0x1F == h264_sps_type and not nal[0] & 0x80:
+            resolution = parse_h264_sps(nal)
+            if resolution:
+                return resolution
+        if codec in (None, "h265") and len(nal) > 2 and (nal[0] >> 1) & 0x3F == h265_sps_type:
+            resolution = parse_h265_sps(nal)
+            if resolution:
+                return resolution
+    return None
+
+
+def get_ts_offset(data: bytes) -> int:
+    """
+    Get the offset of the first aligned TS packet, -1 if the data is not MPEG-TS
+    """
+    for offset in range(min(ts_packet_size, len(data))):
+        if all(
+                data[i] == ts_sync_byte
+                for i in range(offset, min(offset + ts_packet_size * 3, len(data)), ts_packet_size)
+        ) and offset + ts_packet_size * 2 < len(data):
+            return offset
+    return -1
+
+
+def iter_ts_packets(data: bytes, offset: int = 0):
+    """
+    Iterate the (pid, payload_unit_start, payload) of the TS packets
+    """
+    for i in range(offset, len(data) - ts_packet_size + 1, ts_packet_size):
+        packet = data[i:i + ts_packet_size]
+        if packet[0] != ts_sync_byte:
+            continue
+        payload_unit_start = bool(packet[1] & 0x40)
+        pid = ((packet[1] & 0x1F) << 8) | packet[2]
+        adaptation_field_control = (packet[3] >> 4) & 0x03
+        if adaptation_field_control in (0, 2):
+            continue
+        payload_start = 4
+        if adaptation_field_control == 3:
+            payload_start += 1 + packet[4]
+        if payload_start < ts_packet_size:
+            yield pid, payload_unit_start, packet[payload_start:]
+
+
+def get_psi_section(payload: bytes) -> bytes:
+    """
+    Get the PSI section from the payload which starts a section
+    """
+    section = payload[1 + payload[0]:]
+    if len(section) < 3:
+        return b""
+    section_length = ((section[1] & 0x0F) << 8) | section[2]
+    return section[:3 + section_length]
+
+
+def get_ts_video_stream(data: bytes, offset: int = 0) -> tuple[int, str] | None:
+    """
+    Get the video (pid, codec) from the PAT and PMT of the TS data
+    """
+    pmt_pids = set()
+    for pid, payload_unit_start, payload in iter_ts_packets(data, offset):
+        if not payload_unit_start:
+            continue
+        if pid == 0 and not pmt_pids:
+            section = get_psi_section(payload)
+            for i in range(8, len(section) - 4 - 3, 4):
+                program_number = (section[i] << 8) | section[i + 1]
+                if program_number != 0:
+                    pmt_pids.add(((section[i + 2] & 0x1F) << 8) | section[i + 3])
+        elif pid in pmt_pids:
+            section = get_psi_section(payload)
+            if len(section) < 12:
+                continue
+            program_info_length = ((section[10] & 0x0F) << 8) | section[11]
+            i = 12 + program_info_length
+            while i + 5 <= len(section) - 4:
+                stream_type = section[i]
+                elementary_pid = ((section[i + 1] & 0x1F) << 8) | section[i + 2]
+                es_info_length = ((section[i + 3] & 0x0F) << 8) | section[i + 4]
+                if stream_type in h264_stream_types:
+                    return elementary_pid, "h264"
+                if stream_type in h265_stream_types:
+                    return elementary_pid, "h265"
+                if stream_type in mpeg2_stream_types:
+                    return elementary_pid, "mpeg2"
+                i += 5 + es_info_length
+    return None
+
+
+def get_ts_pes_data(data: bytes, video_pid: int, offset: int = 0) -> bytes:
+    """
+    Get the elementary stream data of the video pid from the TS data
+    """
+    chunks = []
+    for pid, payload_unit_start, payload in iter_ts_packets(data, offset):
+        if pid != video_pid:
+            continue
+        if payload_unit_start:
+            if len(payload) < 9 or payload[:3] != b"\x00\x00\x01":
+                continue
+            payload = payload[9 + payload[8]:]
+        chunks.append(payload)
+    return b"".join(chunks)
+
+
+def get_resolution_from_ts(data: bytes) -> tuple[int, int] | None:
+    """
+    Get the resolution from the MPEG-TS data
+    """
+    offset = get_ts_offset(data)
+    if offset == -1:
+        return None
+    video_stream = get_ts_video_stream(data, offset)
+    if video_stream:
+        video_pid, codec = video_stream
+        es_data = get_ts_pes_data(data, video_pid, offset)
+        if codec == "mpeg2":
+            return parse_mpeg2_sequence_header(es_data)
+        return get_resolution_from_annexb(es_data, codec)
+    return get_resolution_from_annexb(data)
+
+
+def get_resolution_from_avc_config(record: bytes) -> tuple[int, int] | None:
+    """
+    Get the resolution from the AVCDecoderConfigurationRecord
+    """
+    if len(record) < 8 or record[0] != 1:
+        return None
+    num_sps = record[5] & 0x1F
+    i = 6
+    for _ in range(num_sps):
+        sps_length = (record[i] << 8) | record[i + 1]
+        resolution = parse_h264_sps(record[i + 2:i + 2 + sps_length])
+        if resolution:
+            return resolution
+        i += 2 + sps_length
+    return None
+
+
+def get_resolution_from_hevc_config(record: bytes) -> tuple[int, int] | None:
+    """
+    Get the resolution from the HEVCDecoderConfigurationRecord
+    """
+    if len(record) < 23 or record[0] != 1:
+        return None
+    i = 23
+    for _ in range(record[22]):
+        if i + 3 > len(record):
+            break
+        nal_type = record[i] & 0x3F
+        num_nalus = (record[i + 1] << 8) | record[i + 2]
+        i += 3
+        for _ in range(num_nalus):
+            nal_length = (record[i] << 8) | record[i + 1]
+            nal = record[i + 2:i + 2 + nal_length]
+            if nal_type == h265_sps_type:
+                resolution = parse_h265_sps(nal)
+                if resolution:
+                    return resolution
+            i += 2 + nal_length
+    return None
+
+
+def get_resolution_from_flv_video_tag(tag: bytes) -> tuple[int, int] | None:
+    """
+    Get the resolution from the FLV video tag data with the sequence header
+    """
+    if len(tag) < 5:
+        return None
+    codec_id = tag[0] & 0x0F
+    if tag[1] != 0:
+        return None
+    try:
+        if codec_id == flv_avc_codec_id:
+            return get_resolution_from_avc_config(tag[5:])
+        if codec_id == flv_hevc_codec_id:
+            return get_resolution_from_hevc_config(tag[5:])
+    except IndexError:
+        pass
+    return None
+
+
+def get_resolution_from_flv(data: bytes) -> tuple[int, int] | None:
+    """
+    Get the resolution from the FLV data
+    """
+    if not data.startswith(b"FLV") or len(data) < 9:
+        return None
+    i = int.from_bytes(data[5:9], "big") + 4
+    while i + 11 <= len(data):
+        tag_type = data[i] & 0x1F
+        data_size = int.from_bytes(data[i + 1:i + 4], "big")
+        if tag_type == flv_video_tag_type:
+            resolution = get_resolution_from_flv_video_tag(data[i + 11:i + 11 + data_size])
+            if resolution:
+                return resolution
+        i += 11 + data_size + 4
+    return None
+
+
+def decode_sdp_parameter_set(value: str) -> bytes:
+    """
+    Decode the base64 parameter set of the SDP fmtp attribute, the padding may be omitted
+    """
+    try:
+        return base64.b64decode(value + "=" * (-len(value) % 4))
+    except (binascii.Error, ValueError):
+        return b""
+
+
+def get_resolution_from_sdp(sdp: str) -> tuple[int, int] | None:
+    """
+    Get the resolution from the SDP of the RTSP stream, by the parameter sets of the fmtp attribute
+    (sprop-parameter-sets of H.264, sprop-sps of H.265) or the size attributes
+    """
+    for line in sdp.splitlines():
+        line = line.strip()
+        if line.startswith("a=fmtp:"):
+            params = dict(
+                item.strip().partition("=")[::2] for item in line.partition(" ")[2].split(";") if item.strip()
+            )
+            for value in params.get("sprop-parameter-sets", "").split(","):
+                nal = decode_sdp_parameter_set(value)
+                if nal and nal[0] & 0x1F == h264_sps_type:
+                    resolution = parse_h264_sps(nal)
+                    if resolution:
+                        return resolution
+            nal = decode_sdp_parameter_set(params.get("sprop-sps", ""))
+            if len(nal) > 2:
+                resolution = parse_h265_sps(nal)
+                if resolution:
+                    return resolution
+        elif line.startswith("a=x-dimensions:") or line.startswith("a=framesize:"):
+            size = line.partition(":")[2].split()[-1].replace("-", ",").split(",")
+            if len(size) == 2 and size[0].isdigit() and size[1].isdigit():
+                return int(size[0]), int(size[1])
+    return None
+
+
+def get_resolution_from_bytes(data: bytes | None) -> str | None:
+    """
+    Get the resolution string (e.g. 1920x1080) from the downloaded video bytes
+    """
+    if not data:
+        return None
+    try:
+        if data.startswith(b"FLV"):
+            resolution = get_resolution_from_flv(data)
+        elif get_ts_offset(data) != -1:
+            resolution = get_resolution_from_ts(data)
+        else:
+            resolution = get_resolution_from_annexb(data)
+    except IndexError:
+        resolution = None
+    return f"{resolution[0]}x{resolution[1]}" if resolution else None